@@ -3,4 +3,6 @@
 SPDX-License-Identifier: BSD-3-Clause
 """
 
-__import__("pkg_resources").declare_namespace(__name__)
+# Declared as a pkgutil-style namespace package, rather than using pkg_resources, as
+# importing pkg_resources adds significant overhead to every CLI invocation.
+__path__ = __import__("pkgutil").extend_path(__path__, __name__)
@@ -23,6 +23,7 @@ PYBIND11_MODULE(archive, module) {
         .def("__iter__", &ArchiveReader::iter)
         .def("__next__", &ArchiveReader::next)
         .def("read", &ArchiveReader::read)
+        .def("readinto", &ArchiveReader::readinto)
         .doc() = "An interface to read archive contents (via libarchive)";
 
     py::class_<ArchiveEntry>(module, "ArchiveEntry")
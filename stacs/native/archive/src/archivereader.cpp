@@ -46,9 +46,13 @@ pybind11::bytes ArchiveReader::read() {
     std::vector<char> chunk;
     chunk.resize(CHUNK_SIZE);
 
-    int result = archive_read_data(this->archive,
-                                   chunk.data(),
-                                   chunk.size());
+    // Release the GIL while libarchive reads and decompresses data, to allow
+    // other Python threads to run in the meantime.
+    int result;
+    {
+        pybind11::gil_scoped_release release;
+        result = archive_read_data(this->archive, chunk.data(), chunk.size());
+    }
 
     if (result < 0) {
         throw ArchiveError();
@@ -57,13 +61,52 @@ pybind11::bytes ArchiveReader::read() {
     return pybind11::bytes(chunk.data(), result);
 }
 
+/**
+ * Reads the currently selected archive member into the provided writable buffer,
+ * returning the number of bytes read. 0 will be returned when no more data is
+ * available.
+ *
+ * This allows the caller to reuse a single buffer for all reads, rather than a new
+ * bytes object being allocated for every chunk.
+ *
+ * @return size_t
+ */
+size_t ArchiveReader::readinto(pybind11::buffer buffer) {
+    pybind11::buffer_info info = buffer.request(true);
+
+    if (info.ndim != 1 || info.strides[0] != info.itemsize) {
+        throw pybind11::value_error("Buffer must be one dimensional and contiguous");
+    }
+
+    // Release the GIL while libarchive reads and decompresses data, to allow
+    // other Python threads to run in the meantime. The buffer cannot be resized
+    // while it is held, as it is exported.
+    la_ssize_t result;
+    {
+        pybind11::gil_scoped_release release;
+        result = archive_read_data(this->archive,
+                                   info.ptr,
+                                   info.size * info.itemsize);
+    }
+
+    if (result < 0) {
+        throw ArchiveError();
+    }
+
+    return result;
+}
+
 /**
  * Find and return the next member in the archive.
  *
  * @return ArchiveEntry
  */
 ArchiveEntry ArchiveReader::next() {
-    int result = archive_read_next_header(this->archive, &this->entry);
+    int result;
+    {
+        pybind11::gil_scoped_release release;
+        result = archive_read_next_header(this->archive, &this->entry);
+    }
 
     if (result == ARCHIVE_OK) {
         return ArchiveEntry(this->entry);
@@ -87,10 +130,15 @@ ArchiveReader *ArchiveReader::enter() {
     archive_read_support_filter_all(this->archive);
     archive_read_support_format_all(this->archive);
 
-    // Attempt to open the archive.
-    int result = archive_read_open_filename(this->archive,
+    // Attempt to open the archive, without holding the GIL as this will block on
+    // disk while reading the archive header.
+    int result;
+    {
+        pybind11::gil_scoped_release release;
+        result = archive_read_open_filename(this->archive,
                                             this->filename.c_str(),
                                             10240);
+    }
 
     if (result != ARCHIVE_OK) {
         throw ArchiveError();
@@ -25,6 +25,7 @@ class ArchiveReader {
               pybind11::object exc_traceback);
 
     pybind11::bytes read();
+    size_t readinto(pybind11::buffer buffer);
     ArchiveEntry next();
     ArchiveReader *iter();
     std::string getFilename();
@@ -3,11 +3,28 @@
 SPDX-License-Identifier: BSD-3-Clause
 """
 
-from stacs.scan import __about__  # noqa:F401
-from stacs.scan import constants  # noqa:F401
-from stacs.scan import filter  # noqa:F401
-from stacs.scan import helper  # noqa:F401
-from stacs.scan import loader  # noqa:F401
-from stacs.scan import model  # noqa:F401
-from stacs.scan import output  # noqa:F401
-from stacs.scan import scanner  # noqa:F401
+import importlib
+from types import ModuleType
+
+# Subpackages are imported on first access (PEP 562), rather than up front, in order
+# to avoid loading the entire package tree on every invocation of the CLI.
+_SUBMODULES = {
+    "__about__",
+    "constants",
+    "exceptions",
+    "filter",
+    "helper",
+    "loader",
+    "model",
+    "output",
+    "scanner",
+}
+
+
+def __getattr__(name: str) -> ModuleType:
+    if name in _SUBMODULES:
+        module = importlib.import_module(f"{__name__}.{name}")
+        globals()[name] = module
+        return module
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
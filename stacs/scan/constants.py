@@ -3,8 +3,14 @@
 SPDX-License-Identifier: BSD-3-Clause
 """
 
-# The size of chunks to use when reading files.
-CHUNK_SIZE = 65536
+# The size of chunks to use when reading files. Larger chunks mean fewer reads and fewer
+# trips around Python level loops when hashing and unpacking, at the cost of one buffer
+# of this size per worker thread.
+CHUNK_SIZE = 1 << 20
+
+# The size of a tar header block, which is read from decompressed streams to check
+# whether they contain a tarball.
+TAR_HEADER_SIZE = 512
 
 # The size, in bytes, of the sample window.
 WINDOW_SIZE = 20
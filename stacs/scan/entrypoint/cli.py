@@ -7,6 +7,7 @@ import logging
 import os
 import shutil
 import sys
+import tempfile
 import time
 from types import TracebackType
 from typing import Callable, List
@@ -28,7 +29,7 @@ def unlink_error(function: Callable, path: str, exc_info: TracebackType):
 
 
 @click.command()
-@click.version_option()
+@click.version_option(version=stacs.scan.__about__.__version__)
 @click.option(
     "--debug",
     is_flag=True,
@@ -63,6 +64,13 @@ def unlink_error(function: Callable, path: str, exc_info: TracebackType):
     help="The path to use as a cache - used when unpacking archives.",
     default=stacs.scan.constants.CACHE_DIRECTORY,
 )
+@click.option(
+    "--rule-cache-directory",
+    help=(
+        "The path to cache compiled rules in, to be reused while rule files are "
+        "unchanged. Changes to files included by rules are not detected."
+    ),
+)
 @click.argument("paths", nargs=-1, required=True)
 def main(
     debug: bool,
@@ -72,6 +80,7 @@ def main(
     ignore_list: str,
     skip_unprocessable: bool,
     cache_directory: str,
+    rule_cache_directory: str,
     paths: List[str],
 ) -> None:
     """STACS - Static Token And Credential Scanner."""
@@ -106,7 +115,7 @@ def main(
             sys.exit(-1)
 
     # Append a timestamp to the cache directory to reduce the chance of collisions.
-    cache_directory = os.path.join(cache_directory, str(int(time.time_ns() / 1000)))
+    cache_directory = os.path.join(cache_directory, str(time.time_ns() // 1000))
     try:
         os.mkdir(cache_directory)
         logger.info(f"Using cache directory at {cache_directory}")
@@ -137,13 +146,13 @@ def main(
     logger.info(f"Found {len(targets)} files for analysis")
 
     findings = []
-    for scanner in stacs.scan.scanner.__all__:
+    for scanner in stacs.scan.scanner.MODULES:
         try:
             findings.extend(
-                getattr(stacs.scan.scanner, scanner).run(targets, pack, workers=threads)
+                scanner.run(targets, pack, workers=threads, cache=rule_cache_directory)
             )
         except stacs.scan.exceptions.InvalidFormatException as err:
-            logger.error(f"Unable to load a rule in scanner {scanner}: {err}")
+            logger.error(f"Unable to load a rule in scanner {scanner.__name__}: {err}")
             continue
 
     # Filter findings by allow list.
@@ -167,14 +176,16 @@ def main(
         stacs.scan.output.pretty.render(findings, pack)
         sys.exit(exit_code)
 
-    # Default to SARIF output to STDOUT.
+    # Default to SARIF output to STDOUT. The document is written to a temporary file as
+    # it's generated, rather than rendered in memory, and only copied to STDOUT once
+    # complete. This ensures that an error while generating it never results in partial
+    # output.
+    # TODO: Add file output as an option.
     logger.info("Generating SARIF from findings")
-    try:
-        sarif = stacs.scan.output.sarif.render(path, findings, pack)
-    except stacs.scan.exceptions.STACSException as err:
-        logger.error(f"Unable to generate SARIF: {err}")
-        sys.exit(-3)
+    with tempfile.TemporaryFile(mode="w+", encoding="utf-8") as sarif:
+        stacs.scan.output.sarif.write(path, findings, pack, sarif)
+        sarif.seek(0)
 
-    # TODO: Add file output as an option.
-    logger.info(f"Found {len(findings)} findings")
-    print(sarif)
+        logger.info(f"Found {len(findings)} findings")
+        shutil.copyfileobj(sarif, sys.stdout)
+        print()
@@ -3,99 +3,103 @@
 SPDX-License-Identifier: BSD-3-Clause
 """
 
+import bisect
+import functools
+import itertools
+import operator
 import re
-from typing import List
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
 
 from stacs.scan.exceptions import IgnoreListException
 from stacs.scan.model import finding, ignore_list
 
 
-def by_pattern(finding: finding.Entry, ignore: ignore_list.Entry) -> bool:
-    """Process a regex ignore list entry."""
-    # Short circuit if no pattern is set.
-    if not ignore.pattern:
-        return False
+@functools.lru_cache(maxsize=None)
+def compile_pattern(pattern: str) -> Pattern[str]:
+    """Compiles an ignore list pattern, caching the result for subsequent calls."""
+    return re.compile(pattern)
 
-    # If there's a match on the path, check whether the ignore is for the same module.
-    if re.search(ignore.pattern, finding.path):
-        if ignore.module != finding.source.module:
-            return False
 
-        # Then check whether the ignore is for the particular reference.
-        if ignore.references:
-            if finding.source.reference in ignore.references:
-                return True
+def compile_prefilter(patterns: Iterable[str]) -> Optional[Pattern[str]]:
+    """Compiles ignore list patterns into a single alternation of all patterns.
 
-            return False
+    The result only indicates whether any of the patterns match a path, not which, so
+    it's used to skip checking patterns individually. None is returned if the patterns
+    cannot be safely combined - such as where they contain groups, which may be back
+    referenced by number, or extensions such as inline flags, which may apply to all of
+    the combined patterns.
+    """
+    patterns = list(dict.fromkeys(patterns))
 
-        # Or check whether the ignore is for the same offest.
-        if ignore.offset is not None:
-            if finding.location.offset == ignore.offset:
-                return True
-            return False
+    for pattern in patterns:
+        if "(?" in pattern or compile_pattern(pattern).groups:
+            return None
 
-        # In this case this is a fairly permissive ignore.
-        return True
+    try:
+        return compile_pattern("|".join(f"(?:{pattern})" for pattern in patterns))
+    except re.error:
+        return None
 
-    return False
 
+def constrained(finding: finding.Entry, ignore: ignore_list.Entry) -> bool:
+    """Checks whether the reference and offset constraints of an ignore are met."""
+    # Check whether the ignore is for the particular reference.
+    if ignore.references:
+        return finding.source.reference in ignore.references
 
-def by_path(finding: finding.Entry, ignore: ignore_list.Entry) -> bool:
-    """Process a path based ignore list entry."""
-    # Short circuit if no path is set.
-    if not ignore.path:
+    # Or check whether the ignore is for the same offest.
+    if ignore.offset is not None:
+        return finding.location.offset == ignore.offset
+
+    # In this case this is a fairly permissive ignore.
+    return True
+
+
+def by_pattern(finding: finding.Entry, ignore: ignore_list.Entry) -> bool:
+    """Process a regex ignore list entry."""
+    # Short circuit if no pattern is set, or the ignore is for a different module.
+    if not ignore.pattern or ignore.module != finding.source.module:
         return False
 
-    # If there's a match on the hash, check whether the ignore is for the same module.
-    if ignore.path == finding.path:
-        if finding.source.module != ignore.module:
-            return False
+    # Check the reference and offset constraints first, as these are much cheaper than
+    # searching the path.
+    if not constrained(finding, ignore):
+        return False
 
-        # Then check whether the ignore is for the particular reference.
-        if ignore.references:
-            if finding.source.reference in ignore.references:
-                return True
-            return False
+    return bool(compile_pattern(ignore.pattern).search(finding.path))
 
-        # Or check whether the ignore is for the same offest.
-        if ignore.offset is not None:
-            if finding.location.offset == ignore.offset:
-                return True
-            return False
 
-        # In this case this is a fairly permissive ignore.
-        return True
+def by_path(finding: finding.Entry, ignore: ignore_list.Entry) -> bool:
+    """Process a path based ignore list entry."""
+    # Short circuit if no path is set, or the ignore is for a different module.
+    if not ignore.path or ignore.module != finding.source.module:
+        return False
 
-    return False
+    if ignore.path != finding.path:
+        return False
+
+    return constrained(finding, ignore)
 
 
 def by_hash(finding: finding.Entry, ignore: ignore_list.Entry) -> bool:
     """Process a hash based ignore list entry."""
-    # Short circuit if no hash is set.
-    if not ignore.md5:
+    # Short circuit if no hash is set, or the ignore is for a different module.
+    if not ignore.md5 or ignore.module != finding.source.module:
         return False
 
-    # If there's a match on the hash, check whether the ignore is for the same module.
-    if ignore.md5 == finding.md5:
-        if finding.source.module != ignore.module:
-            return False
-
-        # Then check whether the ignore is for the particular reference.
-        if ignore.references:
-            if finding.source.reference in ignore.references:
-                return True
-            return False
+    if ignore.md5 != finding.md5:
+        return False
 
-        # Or check whether the ignore is for the same offest.
-        if ignore.offset is not None:
-            if finding.location.offset == ignore.offset:
-                return True
-            return False
+    return constrained(finding, ignore)
 
-        # In this case this is a fairly permissive ignore.
-        return True
 
-    return False
+def matches(finding: finding.Entry, ignore: ignore_list.Entry) -> bool:
+    """Checks whether an ignore list entry applies to a finding."""
+    return (
+        by_hash(finding, ignore)
+        or by_path(finding, ignore)
+        or by_pattern(finding, ignore)
+    )
 
 
 def process(
@@ -105,36 +109,89 @@ def process(
     """Processes an ignore list and marks the relevant findings as ignored."""
     filtered_findings = []
 
-    for entry in findings:
-        for ignore in ignore_list.ignore:
+    # Index the ignore list once up front, rather than checking every ignore against
+    # every finding. The position of each ignore is tracked so that the first matching
+    # ignore in the list still wins, as it would if the list was walked in order.
+    by_hash_idx: Dict[Tuple[str, str], List[Tuple[int, ignore_list.Entry]]] = {}
+    by_path_idx: Dict[Tuple[str, str], List[Tuple[int, ignore_list.Entry]]] = {}
+    patterns: List[Tuple[int, str, Pattern[str], ignore_list.Entry]] = []
+
+    for position, ignore in enumerate(ignore_list.ignore):
+        if ignore.md5:
+            key = (ignore.module, ignore.md5)
+            by_hash_idx.setdefault(key, []).append((position, ignore))
+
+        if ignore.path:
+            key = (ignore.module, ignore.path)
+            by_path_idx.setdefault(key, []).append((position, ignore))
+
+        if ignore.pattern:
             try:
-                if by_path(entry, ignore):
-                    ignore = finding.Ignore(
-                        ignored=True,
-                        reason=ignore.reason,
-                    )
-                    entry.ignore = ignore
-                    break
-
-                if by_pattern(entry, ignore):
-                    ignore = finding.Ignore(
-                        ignored=True,
-                        reason=ignore.reason,
-                    )
-                    entry.ignore = ignore
-                    break
-
-                if by_hash(entry, ignore):
-                    ignore = finding.Ignore(
-                        ignored=True,
-                        reason=ignore.reason,
-                    )
-                    entry.ignore = ignore
-                    break
+                compiled = compile_pattern(ignore.pattern)
             except re.error as err:
                 raise IgnoreListException(
                     f"Error in ignore list entry '{ignore.reason}': {err}"
                 )
+            patterns.append((position, ignore.module, compiled, ignore))
+
+    # Pattern positions are in ascending order, allowing the patterns which appear
+    # before a given position to be found with a bisect.
+    positions = [pattern[0] for pattern in patterns]
+
+    # Combine the patterns for each module into a single pattern. This allows findings
+    # which do not match any pattern - usually the majority - to be ruled out with one
+    # search, rather than one per pattern. Findings from modules without any patterns
+    # do not need to be searched at all.
+    prefilters: Dict[str, Optional[Pattern[str]]] = {}
+
+    for module in dict.fromkeys(pattern[1] for pattern in patterns):
+        prefilters[module] = compile_prefilter(
+            ignore.pattern
+            for _, pattern_module, _, ignore in patterns
+            if pattern_module == module
+        )
+
+    for entry in findings:
+        module = entry.source.module
+
+        # Exact hash and path matches are direct lookups.
+        candidates = by_hash_idx.get((module, entry.md5), []) + by_path_idx.get(
+            (module, entry.path), []
+        )
+        match = next(
+            (
+                (position, ignore)
+                for position, ignore in sorted(candidates, key=operator.itemgetter(0))
+                if constrained(entry, ignore)
+            ),
+            None,
+        )
+
+        # Patterns must still be searched, but only those which appear in the ignore
+        # list before any direct match, and only if any pattern for the module matches.
+        searchable = patterns
+        if module not in prefilters:
+            searchable = []
+        elif prefilters[module] and not prefilters[module].search(entry.path):
+            searchable = []
+        elif match:
+            searchable = itertools.islice(
+                patterns, bisect.bisect_left(positions, match[0])
+            )
+
+        match = next(
+            (
+                (position, ignore)
+                for position, pattern_module, pattern, ignore in searchable
+                if pattern_module == module
+                and constrained(entry, ignore)
+                and pattern.search(entry.path)
+            ),
+            match,
+        )
+
+        if match:
+            entry.ignore = finding.Ignore(ignored=True, reason=match[1].reason)
 
         # Add the finding to our results, whether updated or not.
         filtered_findings.append(entry)
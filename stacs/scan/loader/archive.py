@@ -9,35 +9,59 @@ import hashlib
 import logging
 import lzma
 import os
+import re
 import shutil
 import tarfile
 import zipfile
 import zlib
-from typing import List, Tuple
+from typing import BinaryIO, Dict, List, Optional, Tuple
 
 import zstandard
 from stacs.native import archive
-from stacs.scan.constants import CHUNK_SIZE
+from stacs.scan.constants import CHUNK_SIZE, TAR_HEADER_SIZE
 from stacs.scan.exceptions import FileAccessException, InvalidFileException
 from stacs.scan.loader.format import dmg, xar
 
+# python-isal provides drop-in replacements for the gzip and zlib modules, backed by
+# Intel's ISA-L, which decompress considerably faster than zlib. They're used when
+# installed.
+try:
+    from isal import igzip, isal_zlib
+except ImportError:
+    igzip = None
+    isal_zlib = None
+
+# Matches any leading relative or absolute path components of an archive member, such
+# as "./", "../" and "/", which must be removed to keep members inside of the unpack
+# directory.
+MEMBER_PREFIX = re.compile(r"^(?:\.{1,2}(?:/+|$)|/+)+")
+
 
 def path_hash(filepath: str) -> str:
-    """Returns a hash of the filepath, for use with unique directory creation."""
-    return hashlib.md5(bytes(filepath, "utf-8")).hexdigest()
+    """Returns a hash of the filepath, for use with unique directory creation.
 
+    BLAKE2 is used as it is faster than MD5 for short inputs, and is always available
+    in hashlib. The digest is truncated to the same length as an MD5.
+    """
+    return hashlib.blake2b(bytes(filepath, "utf-8"), digest_size=16).hexdigest()
 
-def zip_handler(filepath: str, directory: str) -> None:
-    """Attempts to extract the provided zip archive."""
-    log = logging.getLogger(__name__)
 
+def create_directory(directory: str) -> None:
+    """Creates the directory to unpack an archive into, if it doesn't already exist."""
     try:
-        os.mkdir(directory, mode=0o700)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
     except OSError as err:
         raise FileAccessException(
             f"Unable to create unpack directory at {directory}: {err}"
         )
 
+
+def zip_handler(filepath: str, directory: str) -> None:
+    """Attempts to extract the provided zip archive."""
+    log = logging.getLogger(__name__)
+
+    create_directory(directory)
+
     # Attempt to unpack the zipfile to the new unpack directory.
     try:
         with zipfile.ZipFile(filepath, "r") as reader:
@@ -67,12 +91,7 @@ def zip_handler(filepath: str, directory: str) -> None:
 
 def tar_handler(filepath: str, directory: str) -> None:
     """Attempts to extract the provided tarball."""
-    try:
-        os.mkdir(directory, mode=0o700)
-    except OSError as err:
-        raise FileAccessException(
-            f"Unable to create unpack directory at {directory}: {err}"
-        )
+    create_directory(directory)
 
     # Attempt to unpack the tarball to the new unpack directory.
     try:
@@ -84,7 +103,35 @@ def tar_handler(filepath: str, directory: str) -> None:
         )
 
 
-def gzip_handler(filepath: str, directory: str) -> None:
+def is_tarball(fin: BinaryIO) -> bool:
+    """Checks whether the provided decompressed stream contains a tarball.
+
+    The header is read from the current position of the stream, so the caller must
+    rewind the stream before reading it again.
+    """
+    (_, mime) = get_mimetype(fin.read(TAR_HEADER_SIZE), True)
+
+    return mime == "application/x-tar"
+
+
+def tar_stream_handler(fin: BinaryIO, filepath: str, directory: str) -> None:
+    """Attempts to extract a tarball directly from the provided decompressed stream.
+
+    This allows compressed tarballs to be extracted in a single pass, rather than first
+    writing out the decompressed tarball only for it to be processed again. Handlers
+    which do so return the name the tarball would have been written out as, which is
+    used as an intermediate component of the overlay path of the extracted files.
+    """
+    try:
+        with tarfile.open(fileobj=fin, mode="r|") as reader:
+            reader.extractall(directory)
+    except (PermissionError, tarfile.TarError) as err:
+        raise InvalidFileException(
+            f"Unable to extract archive {filepath} to {directory}: {err}"
+        )
+
+
+def gzip_handler(filepath: str, directory: str) -> Optional[str]:
     """Attempts to extract the provided gzip archive."""
     output = ".".join(os.path.basename(filepath).split(".")[:-1])
 
@@ -94,26 +141,32 @@ def gzip_handler(filepath: str, directory: str) -> None:
 
     # Although gzip files cannot contain more than one file, we'll still spool into
     # a subdirectory under the cache for consistency.
-    try:
-        os.mkdir(directory, mode=0o700)
-    except OSError as err:
-        raise FileAccessException(
-            f"Unable to create unpack directory at {directory}: {err}"
-        )
+    create_directory(directory)
+
+    opener = igzip.open if igzip else gzip.open
 
-    # TODO: This can likely be optimized for tgz files, as currently the file will be
-    #       first processed and gunzipped, and then reprocessed to be extracted.
+    # Compressed tarballs are extracted directly from the decompressed stream.
     try:
-        with gzip.open(filepath, "rb") as fin:
-            with open(os.path.join(directory, output), "wb") as fout:
-                shutil.copyfileobj(fin, fout, CHUNK_SIZE)
+        with opener(filepath, "rb") as fin:
+            tarball = is_tarball(fin)
+            fin.seek(0)
+
+            if tarball:
+                tar_stream_handler(fin, filepath, directory)
+            else:
+                with open(os.path.join(directory, output), "wb") as fout:
+                    shutil.copyfileobj(fin, fout, CHUNK_SIZE)
     except gzip.BadGzipFile as err:
         raise InvalidFileException(
             f"Unable to extract archive {filepath} to {output}: {err}"
         )
 
+    # The name of a tarball extracted directly from the stream is returned, so that
+    # files inside of it have the same overlay path as if it had been written out.
+    return output if tarball else None
 
-def bzip2_handler(filepath: str, directory: str) -> None:
+
+def bzip2_handler(filepath: str, directory: str) -> Optional[str]:
     """Attempts to extract the provided bzip2 archive."""
     output = ".".join(os.path.basename(filepath).split(".")[:-1])
 
@@ -123,26 +176,30 @@ def bzip2_handler(filepath: str, directory: str) -> None:
 
     # Like gzip, bzip2 cannot support more than a single file. Again, we'll spool into
     # a subdirectory for consistency.
-    try:
-        os.mkdir(directory, mode=0o700)
-    except OSError as err:
-        raise FileAccessException(
-            f"Unable to create unpack directory at {directory}: {err}"
-        )
+    create_directory(directory)
 
-    # TODO: This can likely be optimized for tbz files, as currently the file will be
-    #       first processed and gunzipped, and then reprocessed to be extracted.
+    # Compressed tarballs are extracted directly from the decompressed stream.
     try:
         with bz2.open(filepath, "rb") as fin:
-            with open(os.path.join(directory, output), "wb") as fout:
-                shutil.copyfileobj(fin, fout, CHUNK_SIZE)
+            tarball = is_tarball(fin)
+            fin.seek(0)
+
+            if tarball:
+                tar_stream_handler(fin, filepath, directory)
+            else:
+                with open(os.path.join(directory, output), "wb") as fout:
+                    shutil.copyfileobj(fin, fout, CHUNK_SIZE)
     except (OSError, ValueError) as err:
         raise InvalidFileException(
             f"Unable to extract archive {filepath} to {output}: {err}"
         )
 
+    # The name of a tarball extracted directly from the stream is returned, so that
+    # files inside of it have the same overlay path as if it had been written out.
+    return output if tarball else None
+
 
-def zstd_handler(filepath: str, directory: str) -> None:
+def zstd_handler(filepath: str, directory: str) -> Optional[str]:
     """Attempts to extract the provided zstd archive."""
     output = ".".join(os.path.basename(filepath).split(".")[:-1])
 
@@ -152,26 +209,37 @@ def zstd_handler(filepath: str, directory: str) -> None:
 
     # zstd does not appear to provide a native mechanism to compress multiple files,
     # and recommend 'to combine zstd with tar'.
-    try:
-        os.mkdir(directory, mode=0o700)
-    except OSError as err:
-        raise FileAccessException(
-            f"Unable to create unpack directory at {directory}: {err}"
-        )
+    create_directory(directory)
 
+    # Compressed tarballs are extracted directly from the decompressed stream. As zstd
+    # stream readers cannot be rewound, a new reader is used once the header is read.
     try:
         decompressor = zstandard.ZstdDecompressor()
 
         with open(filepath, "rb") as fin:
-            with open(os.path.join(directory, output), "wb") as fout:
-                decompressor.copy_stream(fin, fout, read_size=CHUNK_SIZE)
+            with decompressor.stream_reader(fin, closefd=False) as reader:
+                tarball = is_tarball(reader)
+            fin.seek(0)
+
+            if tarball:
+                with decompressor.stream_reader(
+                    fin, read_size=CHUNK_SIZE, closefd=False
+                ) as reader:
+                    tar_stream_handler(reader, filepath, directory)
+            else:
+                with open(os.path.join(directory, output), "wb") as fout:
+                    decompressor.copy_stream(fin, fout, read_size=CHUNK_SIZE)
     except (OSError, ValueError, zstandard.ZstdError) as err:
         raise InvalidFileException(
             f"Unable to extract archive {filepath} to {output}: {err}"
         )
 
+    # The name of a tarball extracted directly from the stream is returned, so that
+    # files inside of it have the same overlay path as if it had been written out.
+    return output if tarball else None
+
 
-def lzma_handler(filepath: str, directory: str) -> None:
+def lzma_handler(filepath: str, directory: str) -> Optional[str]:
     """Attempts to extract the provided xz / lzma archive."""
     output = ".".join(os.path.basename(filepath).split(".")[:-1])
 
@@ -181,22 +249,28 @@ def lzma_handler(filepath: str, directory: str) -> None:
 
     # Although xz files cannot contain more than one file, we'll still spool into
     # a subdirectory under the cache for consistency.
-    try:
-        os.mkdir(directory, mode=0o700)
-    except OSError as err:
-        raise FileAccessException(
-            f"Unable to create unpack directory at {directory}: {err}"
-        )
+    create_directory(directory)
 
+    # Compressed tarballs are extracted directly from the decompressed stream.
     try:
         with lzma.open(filepath, "rb") as fin:
-            with open(os.path.join(directory, output), "wb") as fout:
-                shutil.copyfileobj(fin, fout, CHUNK_SIZE)
+            tarball = is_tarball(fin)
+            fin.seek(0)
+
+            if tarball:
+                tar_stream_handler(fin, filepath, directory)
+            else:
+                with open(os.path.join(directory, output), "wb") as fout:
+                    shutil.copyfileobj(fin, fout, CHUNK_SIZE)
     except lzma.LZMAError as err:
         raise InvalidFileException(
             f"Unable to extract archive {filepath} to {output}: {err}"
         )
 
+    # The name of a tarball extracted directly from the stream is returned, so that
+    # files inside of it have the same overlay path as if it had been written out.
+    return output if tarball else None
+
 
 def zlib_handler(filepath: str, directory: str) -> None:
     """Attempts to extract the provided zlib archive."""
@@ -206,21 +280,23 @@ def zlib_handler(filepath: str, directory: str) -> None:
     if len(output) < 1:
         output = os.path.basename(filepath)
 
-    try:
-        os.mkdir(directory, mode=0o700)
-    except OSError as err:
-        raise FileAccessException(
-            f"Unable to create unpack directory at {directory}: {err}"
-        )
+    create_directory(directory)
+
+    codec = isal_zlib if isal_zlib else zlib
 
     try:
-        decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS)
+        decompressor = codec.decompressobj(wbits=codec.MAX_WBITS)
 
         with open(filepath, "rb") as fin:
             with open(os.path.join(directory, output), "wb") as fout:
+                # Bound the output of each call, as a single chunk of highly
+                # compressible input could otherwise decompress into a very large
+                # buffer.
                 while compressed := fin.read(CHUNK_SIZE):
-                    fout.write(decompressor.decompress(compressed))
-    except zlib.error as err:
+                    while compressed:
+                        fout.write(decompressor.decompress(compressed, CHUNK_SIZE))
+                        compressed = decompressor.unconsumed_tail
+    except codec.error as err:
         raise InvalidFileException(
             f"Unable to extract archive {filepath} to {output}: {err}"
         )
@@ -228,12 +304,7 @@ def zlib_handler(filepath: str, directory: str) -> None:
 
 def xar_handler(filepath: str, directory: str) -> None:
     """Attempts to extract the provided XAR archive."""
-    try:
-        os.mkdir(directory, mode=0o700)
-    except OSError as err:
-        raise FileAccessException(
-            f"Unable to create unpack directory at {directory}: {err}"
-        )
+    create_directory(directory)
 
     # Attempt to unpack the archive.
     try:
@@ -251,12 +322,7 @@ def xar_handler(filepath: str, directory: str) -> None:
 
 def dmg_handler(filepath: str, directory: str) -> None:
     """Attempts to extract the provided DMG archive."""
-    try:
-        os.mkdir(directory, mode=0o700)
-    except OSError as err:
-        raise FileAccessException(
-            f"Unable to create unpack directory at {directory}: {err}"
-        )
+    create_directory(directory)
 
     # Attempt to unpack the archive.
     try:
@@ -274,20 +340,23 @@ def dmg_handler(filepath: str, directory: str) -> None:
 
 def libarchive_handler(filepath: str, directory: str) -> None:
     """Attempts to extract the provided archive with libarchive."""
-    try:
-        os.mkdir(directory, mode=0o700)
-    except OSError as err:
-        raise FileAccessException(
-            f"Unable to create unpack directory at {directory}: {err}"
-        )
+    create_directory(directory)
+
+    # Track directories which have already been created, as archives often contain
+    # many members in the same directory. This avoids checking the filesystem again for
+    # every member.
+    created = set()
+
+    # Members are read into a single buffer which is reused for every chunk, rather
+    # than allocating a new bytes object per read.
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
 
     # Attempt to unpack the archive to the new unpack directory.
     try:
         with archive.ArchiveReader(filepath) as reader:
             for entry in reader:
-                member = entry.filename
-                member = member.lstrip("../")
-                member = member.lstrip("./")
+                member = MEMBER_PREFIX.sub("", entry.filename)
 
                 if entry.filename == ".":
                     continue
@@ -295,30 +364,28 @@ def libarchive_handler(filepath: str, directory: str) -> None:
                 destination = os.path.join(directory, member)
                 parent = os.path.dirname(destination)
 
-                # Handle odd cases where a file was created where a directory needs to
-                # be.
-                if os.path.exists(parent) and os.path.isfile(parent):
-                    os.unlink(parent)
-
-                if os.path.isdir(destination):
+                if destination in created or os.path.isdir(destination):
                     continue
 
                 # Create parent directories, as required.
-                if not os.path.isdir(parent):
-                    os.makedirs(parent)
+                if parent not in created:
+                    # Handle odd cases where a file was created where a directory needs
+                    # to be.
+                    if os.path.isfile(parent):
+                        os.unlink(parent)
+
+                    os.makedirs(parent, exist_ok=True)
+                    created.add(parent)
 
                 # If the entry is a directory, create it and move on.
                 if entry.isdir:
                     os.makedirs(destination, exist_ok=True)
+                    created.add(destination)
                     continue
 
                 with open(destination, "wb") as fout:
-                    while True:
-                        chunk = reader.read()
-                        if len(chunk) > 0:
-                            fout.write(chunk)
-                            continue
-                        break
+                    while length := reader.readinto(buffer):
+                        fout.write(view[:length])
     except archive.ArchiveError as err:
         raise InvalidFileException(
             f"Unable to extract archive {filepath} to {directory}: {err}"
@@ -340,10 +407,9 @@ def get_mimetype(chunk: bytes, start: bool) -> List[Tuple[int, str]]:
     handlers and is used to allow "container" formats, which may contain multiple other
     files of various matching types, to "win" the match - due to a higher weight.
     """
-    for name, options in MIME_TYPE_HANDLERS.items():
-        offset = options["offset"]
-        magic = options["magic"]
+    match = None
 
+    for (offset, length), candidates in MAGIC_LOOKUP.items():
         # If looking at the last chunk, only use negative offsets. This is to prevent
         # false positives as position 0 in the last chunk is actually N bytes into the
         # file. This is especially problematic for formats with short magic numbers,
@@ -352,13 +418,34 @@ def get_mimetype(chunk: bytes, start: bool) -> List[Tuple[int, str]]:
             continue
 
         # TODO: How to handle multiple matches in the same chunk? Is this this likely?
-        for format in magic:
-            if chunk[offset : (offset + len(format))] == format:  # noqa: E203
-                return (options["weight"], name)
+        candidate = candidates.get(bytes(chunk[offset : (offset + length)]))
+        if candidate and (match is None or candidate < match):
+            match = candidate
+
+    if match:
+        return (match[1], match[2])
 
     return (0, None)
 
 
+def lookup_table() -> Dict[Tuple[int, int], Dict[bytes, Tuple[int, int, str]]]:
+    """Builds a lookup table of magic from the supported archive handlers.
+
+    Magic is grouped by offset and length, allowing each group to be checked with a
+    single slice and dictionary lookup, rather than comparing every magic in turn. The
+    position of each handler is kept so that, if multiple handlers match, the first
+    defined still wins.
+    """
+    table = {}
+
+    for position, (name, options) in enumerate(MIME_TYPE_HANDLERS.items()):
+        for magic in options["magic"]:
+            group = table.setdefault((options["offset"], len(magic)), {})
+            group.setdefault(magic, (position, options["weight"], name))
+
+    return table
+
+
 # Define all supported archives and their handlers. As we currently only support a small
 # list of types we can just define file magic directly here, rather than use an external
 # library. This removes the need for dependencies which may have other system
@@ -369,7 +456,7 @@ MIME_TYPE_HANDLERS = {
         "weight": 1,
         "offset": 257,
         "magic": [
-            bytearray([0x75, 0x73, 0x74, 0x61, 0x72]),
+            b"ustar",
         ],
         "handler": tar_handler,
     },
@@ -377,7 +464,7 @@ MIME_TYPE_HANDLERS = {
         "weight": 1,
         "offset": 0,
         "magic": [
-            bytearray([0x1F, 0x8B]),
+            b"\x1f\x8b",
         ],
         "handler": gzip_handler,
     },
@@ -385,7 +472,7 @@ MIME_TYPE_HANDLERS = {
         "weight": 1,
         "offset": 0,
         "magic": [
-            bytearray([0x42, 0x5A, 0x68]),
+            b"BZh",
         ],
         "handler": bzip2_handler,
     },
@@ -393,9 +480,9 @@ MIME_TYPE_HANDLERS = {
         "weight": 1,
         "offset": 0,
         "magic": [
-            bytearray([0x50, 0x4B, 0x03, 0x04]),
-            bytearray([0x50, 0x4B, 0x05, 0x06]),
-            bytearray([0x50, 0x4B, 0x07, 0x08]),
+            b"\x50\x4b\x03\x04",
+            b"\x50\x4b\x05\x06",
+            b"\x50\x4b\x07\x08",
         ],
         "handler": zip_handler,
     },
@@ -403,10 +490,10 @@ MIME_TYPE_HANDLERS = {
         "weight": 1,
         "offset": 0,
         "magic": [
-            bytearray([0x78, 0x01]),
-            bytearray([0x78, 0x5E]),
-            bytearray([0x78, 0x9C]),
-            bytearray([0x78, 0xDA]),
+            b"\x78\x01",
+            b"\x78\x5e",
+            b"\x78\x9c",
+            b"\x78\xda",
         ],
         "handler": zlib_handler,
     },
@@ -414,7 +501,7 @@ MIME_TYPE_HANDLERS = {
         "weight": 1,
         "offset": 0,
         "magic": [
-            bytearray([0xFD, 0x37, 0x7A, 0x58, 0x5A, 0x00]),
+            b"\xfd\x37\x7a\x58\x5a\x00",
         ],
         "handler": lzma_handler,
     },
@@ -422,7 +509,7 @@ MIME_TYPE_HANDLERS = {
         "weight": 1,
         "offset": 0,
         "magic": [
-            bytearray([0xED, 0xAB, 0xEE, 0xDB]),
+            b"\xed\xab\xee\xdb",
         ],
         "handler": libarchive_handler,
     },
@@ -430,7 +517,7 @@ MIME_TYPE_HANDLERS = {
         "weight": 1,
         "offset": 0x8001,
         "magic": [
-            bytearray([0x43, 0x44, 0x30, 0x30, 0x31]),
+            b"CD001",
         ],
         "handler": libarchive_handler,
     },
@@ -438,7 +525,7 @@ MIME_TYPE_HANDLERS = {
         "weight": 1,
         "offset": 0,
         "magic": [
-            bytearray([0x37, 0x7A, 0xBC, 0xAF, 0x27, 0x1C]),
+            b"\x37\x7a\xbc\xaf\x27\x1c",
         ],
         "handler": libarchive_handler,
     },
@@ -446,11 +533,11 @@ MIME_TYPE_HANDLERS = {
         "weight": 1,
         "offset": 0,
         "magic": [
-            bytearray([0xC7, 0x71]),  # 070707 in octal (Little Endian).
-            bytearray([0x71, 0xC7]),  # 070707 in octal (Big Endian).
-            bytearray([0x30, 0x37, 0x30, 0x37, 0x30, 0x31]),  # "070701"
-            bytearray([0x30, 0x37, 0x30, 0x37, 0x30, 0x32]),  # "070702"
-            bytearray([0x30, 0x37, 0x30, 0x37, 0x30, 0x37]),  # "070707"
+            b"\xc7\x71",  # 070707 in octal (Little Endian).
+            b"\x71\xc7",  # 070707 in octal (Big Endian).
+            b"070701",
+            b"070702",
+            b"070707",
         ],
         "handler": libarchive_handler,
     },
@@ -458,7 +545,7 @@ MIME_TYPE_HANDLERS = {
         "weight": 1,
         "offset": 0,
         "magic": [
-            bytearray([0x78, 0x61, 0x72, 0x21]),
+            b"xar!",
         ],
         "handler": xar_handler,
     },
@@ -466,7 +553,7 @@ MIME_TYPE_HANDLERS = {
         "weight": 1,
         "offset": 0,
         "magic": [
-            bytearray([0x4D, 0x53, 0x43, 0x46]),
+            b"MSCF",
         ],
         "handler": libarchive_handler,
     },
@@ -474,7 +561,7 @@ MIME_TYPE_HANDLERS = {
         "weight": 1,
         "offset": 0,
         "magic": [
-            bytearray([0x21, 0x3C, 0x61, 0x72, 0x63, 0x68, 0x3E]),
+            b"!<arch>",
         ],
         "handler": libarchive_handler,
     },
@@ -482,7 +569,7 @@ MIME_TYPE_HANDLERS = {
         "weight": 1,
         "offset": 0,
         "magic": [
-            bytearray([0x52, 0x61, 0x72, 0x21, 0x1A, 0x07]),
+            b"\x52\x61\x72\x21\x1a\x07",
         ],
         "handler": libarchive_handler,
     },
@@ -490,7 +577,7 @@ MIME_TYPE_HANDLERS = {
         "weight": 1,
         "offset": 0,
         "magic": [
-            bytearray([0x28, 0xB5, 0x2F, 0xFD]),
+            b"\x28\xb5\x2f\xfd",
         ],
         "handler": zstd_handler,
     },
@@ -498,8 +585,19 @@ MIME_TYPE_HANDLERS = {
         "weight": 2,  # "container" formats are weighted higher.
         "offset": -512,
         "magic": [
-            bytearray([0x6B, 0x6F, 0x6C, 0x79]),
+            b"koly",
         ],
         "handler": dmg_handler,
     },
 }
+
+# Build the magic lookup table once, now that all handlers are defined.
+MAGIC_LOOKUP = lookup_table()
+
+# Map mime-types to their handler, for mime-types which can be unpacked. This avoids
+# looking up the handler through the full definition for every file.
+ARCHIVE_HANDLERS = {
+    mime: options["handler"]
+    for mime, options in MIME_TYPE_HANDLERS.items()
+    if options.get("handler")
+}
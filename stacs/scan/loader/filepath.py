@@ -4,12 +4,13 @@ SPDX-License-Identifier: BSD-3-Clause
 """
 
 import hashlib
+import itertools
 import logging
 import os
-import re
+import queue
 import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Tuple
 
 from stacs.scan.constants import ARCHIVE_FILE_SEPARATOR, CHUNK_SIZE
 from stacs.scan.exceptions import FileAccessException, InvalidFileException
@@ -18,35 +19,53 @@ from stacs.scan.model.manifest import Entry
 
 logger = logging.getLogger(__name__)
 
+# The minimum number of files to generate metadata for in each task submitted to the
+# pool. Files are batched to amortise the cost of submitting and collecting a task for
+# every file, which dominates when processing many small files.
+METADATA_BATCH_SIZE = 8
+
 
 def metadata(filepath: str, overlay: str = None, parent: str = None) -> Entry:
     """Generates a hash and determines the mimetype of the input file."""
     md5 = hashlib.md5()
-    mime = None
-    winner = 0
 
     # Read the file in chunks.
     try:
-        stat = os.stat(filepath)
-
         with open(filepath, "rb") as fin:
-            while chunk := fin.read(CHUNK_SIZE):
+            stat = os.fstat(fin.fileno())
+
+            # Read into a single buffer which is reused for every chunk, rather than
+            # allocating a new bytes object per read. The buffer is sized to the file
+            # to avoid allocating a full chunk for small files, unless the size is not
+            # known.
+            buffer = bytearray(min(stat.st_size, CHUNK_SIZE) or CHUNK_SIZE)
+            view = memoryview(buffer)
+
+            # Attempt to determine the mime-type using the first and last chunk. The
+            # first chunk is checked before the rest of the file is hashed, and the last
+            # chunk remains in the buffer once the file has been read. For files smaller
+            # than a chunk, these are the same chunk, so both checks must be performed.
+            # Note: This may need to change further in future.
+            length = fin.readinto(buffer)
+            chunk = view[:length]
+            md5.update(chunk)
+            (winner, mime) = archive.get_mimetype(chunk, True)
+
+            while length := fin.readinto(buffer):
+                chunk = view[:length]
                 md5.update(chunk)
 
-                # Attempt to determine the mime-type using the first and last chunk.
-                # Note: This may need to change further in future.
-                if (not mime and fin.tell() <= CHUNK_SIZE) or len(chunk) < CHUNK_SIZE:
-                    start = False if len(chunk) < CHUNK_SIZE else True
-                    (score, candidate) = archive.get_mimetype(chunk, start)
+            (score, candidate) = archive.get_mimetype(chunk, False)
 
-                    # Swap the winner if the score is higher.
-                    if score > winner:
-                        mime = candidate
-                        winner = score
+            # Swap the winner if the score is higher.
+            if score > winner:
+                mime = candidate
     except OSError as err:
         raise FileAccessException(f"Unable to open file at {filepath}: {err}")
 
-    return Entry(
+    # Entries are constructed without validation, as all fields are generated here and
+    # already have the correct types.
+    return Entry.construct(
         path=filepath,
         md5=md5.hexdigest(),
         mime=mime,
@@ -56,23 +75,49 @@ def metadata(filepath: str, overlay: str = None, parent: str = None) -> Entry:
     )
 
 
-def walker(path: str, skip_on_eacces: bool) -> List[str]:
-    """Recursively walk a file path, returning a list of all files."""
+def metadata_batch(
+    files: List[Tuple[str, str]], parent: str = None, skip_on_eacces: bool = True
+) -> List[Entry]:
+    """Generates metadata for a batch of files, and their optional overlays."""
     entries = []
 
-    # TODO: Would moving walker to a generator yield a performance increase, or lead to
-    #       higher disk contention due to the hasher running at the same time?
+    for file, overlay in files:
+        try:
+            entries.append(metadata(file, overlay=overlay, parent=parent))
+        except FileAccessException:
+            if not skip_on_eacces:
+                raise
+
+    return entries
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[List]:
+    """Yields lists of up to size items from the input iterable."""
+    iterator = iter(iterable)
+
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def walker(path: str, skip_on_eacces: bool) -> Iterator[str]:
+    """Recursively walk a file path, yielding all files.
+
+    As this is a generator, files can be submitted for processing while the rest of the
+    tree is still being walked, rather than after the entire tree is in memory.
+    """
     try:
         with os.scandir(path) as scan:
             for handle in scan:
                 try:
-                    # Recurse on directories, but not symlinks.
-                    if handle.is_dir() and not handle.is_symlink():
-                        entries.extend(walker(handle.path, skip_on_eacces))
+                    # Recurse on directories, but not symlinks. Not following symlinks
+                    # allows the type to be answered from the directory entry itself,
+                    # without an additional stat call, on most filesystems.
+                    if handle.is_dir(follow_symlinks=False):
+                        yield from walker(handle.path, skip_on_eacces)
 
                     # Track files, but not symlinks.
-                    if handle.is_file() and not handle.is_symlink():
-                        entries.append(handle.path)
+                    elif handle.is_file(follow_symlinks=False):
+                        yield handle.path
                 except PermissionError:
                     if not skip_on_eacces:
                         raise
@@ -81,9 +126,7 @@ def walker(path: str, skip_on_eacces: bool) -> List[str]:
                     # cases are likely with a large enough input.
                     continue
     except NotADirectoryError:
-        entries.append(path)
-
-    return list(set(entries))
+        yield path
 
 
 def qualify(path: str) -> str:
@@ -94,6 +137,59 @@ def qualify(path: str) -> str:
         return path
 
 
+def unpack(
+    entry: Entry,
+    cache: str,
+    skip_on_eacces: bool = True,
+    skip_on_corrupt: bool = False,
+) -> List[Tuple[str, str]]:
+    """Unpacks an archive into the cache, returning the path and overlay of files."""
+    handler = archive.ARCHIVE_HANDLERS[entry.mime]
+    files = []
+
+    # Remove any existing previously unpacked files, then unpack the archive.
+    destination = os.path.join(cache, archive.path_hash(entry.path))
+    shutil.rmtree(destination, ignore_errors=True)
+
+    # Handlers which extract a compressed tarball directly return the name of the
+    # intermediate tarball, as it is not written out into the destination.
+    member = None
+
+    try:
+        member = handler(entry.path, destination)
+    except InvalidFileException as err:
+        # Only skip with a warning if explicitly configured to do so.
+        if skip_on_corrupt:
+            logger.warning(
+                f"Skipping file at {entry.path} due to error when processing: {err}"
+            )
+        else:
+            raise
+
+    # The overlay path is a 'virtual' path that is constructed based on the archive
+    # the file appears inside of, and the path of the file inside of the archive.
+    # However, as archives may be nested, we need to check whether we already have an
+    # overlay and, if set, use that value instead.
+    if entry.overlay:
+        parent = entry.overlay
+    else:
+        parent = entry.path
+
+    if member:
+        parent = f"{parent}{ARCHIVE_FILE_SEPARATOR}{member}"
+
+    # All files are yielded from under the destination, so the path inside of the
+    # archive is found by slicing off the destination rather than matching it.
+    prefix = len(destination)
+
+    for file in walker(destination, skip_on_eacces):
+        logger.debug(f"Processing {file}, extracted from archive {parent}")
+        overlay = f"{parent}{ARCHIVE_FILE_SEPARATOR}{file[prefix:].lstrip(os.sep)}"
+        files.append((file, overlay))
+
+    return files
+
+
 def finder(
     path: str,
     cache: str,
@@ -104,79 +200,50 @@ def finder(
     """Processes the input path, returning a list of all files and their hashes."""
     entries = []
     futures = dict()
+    completed = queue.SimpleQueue()
+
+    def submit(unpacking, fn, *args, **kwargs):
+        """Submit work to the pool, queuing the future once it has completed."""
+        future = pool.submit(fn, *args, **kwargs)
+        futures[future] = unpacking
+        future.add_done_callback(completed.put)
 
     # Run the metadata enumerator in a thread pool as we're likely to be I/O bound.
+    # Archives are also unpacked in the same pool, allowing multiple archives to be
+    # unpacked concurrently. Each future is tracked along with the archive it is
+    # unpacking, or None if it is generating metadata for a file.
     with ThreadPoolExecutor(max_workers=workers) as pool:
-        futures = {
-            pool.submit(metadata, file): file for file in walker(path, skip_on_eacces)
-        }
-
-        # A loop and counter is used here to ensure that additional work which may be
-        # submitted during the 'final loop' isn't accidentally ignored.
-        while True:
-            complete = 0
-            for future in as_completed(futures):
-                complete += 1
-
-                try:
-                    result = future.result()
-                except FileAccessException:
-                    if not skip_on_eacces:
-                        raise
-
-                # Track the result and then remove the future from the initial futures
-                # list so that these results aren't returned again next iteration.
+        files = ((file, None) for file in walker(path, skip_on_eacces))
+        for batch in batched(files, METADATA_BATCH_SIZE):
+            submit(None, metadata_batch, batch, None, skip_on_eacces)
+
+        # Futures are collected from the queue as they complete, so additional work
+        # submitted while processing results is picked up without rescanning the
+        # futures which are still pending.
+        while futures:
+            future = completed.get()
+            unpacked = futures.pop(future)
+
+            # Submit files extracted from an archive back into the queue. This is to
+            # allow for easy recursive unpacking of nested archives. Files are split
+            # into a batch per worker, so large archives are still spread across the
+            # pool.
+            if unpacked is not None:
+                files = future.result()
+                size = max(METADATA_BATCH_SIZE, -(-len(files) // workers))
+
+                for batch in batched(files, size):
+                    submit(None, metadata_batch, batch, unpacked.md5, skip_on_eacces)
+                continue
+
+            # Track the results, and check if any file was found to be an archive.
+            # If so, submit it to be unpacked.
+            for result in future.result():
                 entries.append(result)
-                del futures[future]
 
-                # Check it the file was found to be an archive, and if so, unpack it.
-                handler = archive.MIME_TYPE_HANDLERS.get(result.mime, {}).get("handler")
-                if not handler:
+                if result.mime not in archive.ARCHIVE_HANDLERS:
                     continue
 
-                # Remove any existing previously unpacked files, then unpack the archive
-                # and submit extracted files back into the queue. This is to allow for
-                # easy recursive unpacking of nested archives.
-                destination = os.path.join(cache, archive.path_hash(result.path))
-                shutil.rmtree(destination, ignore_errors=True)
-
-                try:
-                    handler(result.path, destination)
-                except InvalidFileException as err:
-                    # Only skip with a warning if explicitly configured to do so.
-                    if skip_on_corrupt:
-                        logger.warning(
-                            f"Skipping file at {result.path} due to error when "
-                            f"processing: {err}"
-                        )
-                    else:
-                        raise
-
-                for file in walker(destination, skip_on_eacces):
-                    # The overlay path is a 'virtual' path that is constructed based on
-                    # the archive the file appears inside of, and the path of the file
-                    # inside of the archive. However, as archives may be nested, we need
-                    # to check whether we already have an overlay and, if set, use that
-                    # value instead.
-                    if result.overlay:
-                        parent = result.overlay
-                    else:
-                        parent = result.path
-
-                    logger.debug(f"Processing {file}, extracted from archive {parent}")
-                    overlay = (
-                        f"{parent}"
-                        f"{ARCHIVE_FILE_SEPARATOR}"
-                        f"{re.sub(rf'^{destination}/?', '', file)}"
-                    )
-
-                    # Submit back to the pool for processing.
-                    submission = pool.submit(
-                        metadata, file, overlay=overlay, parent=result.md5
-                    )
-                    futures[submission] = file
-
-            if complete == 0:
-                break
+                submit(result, unpack, result, cache, skip_on_eacces, skip_on_corrupt)
 
     return entries
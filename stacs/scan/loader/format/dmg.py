@@ -10,25 +10,37 @@ import plistlib
 import struct
 import zlib
 from collections import namedtuple
-from typing import List
+from typing import BinaryIO, List, Union
 
 from pydantic import BaseModel, Extra, Field
+from stacs.scan.constants import CHUNK_SIZE
 from stacs.scan.exceptions import FileAccessException, InvalidFileException
 
+# python-isal provides a drop-in replacement for the zlib module, backed by Intel's
+# ISA-L, which decompresses considerably faster than zlib. It's used when installed.
+try:
+    from isal import isal_zlib
+except ImportError:
+    isal_zlib = None
+
 # Structures names and geometry are via "Demystifying the DMG File Format"
-# by Jonathan Levin (http://newosxbook.com/).
+# by Jonathan Levin (http://newosxbook.com/). Each structure is also compiled once,
+# rather than its format being looked up on every unpack.
 DMG_HEADER_MAGIC = b"koly"
 DMG_HEADER = ">4sIIIQQQQQII16sII128sQQ120sII128sIQIII"
 DMG_HEADER_MAGIC_SZ = len(DMG_HEADER_MAGIC)
 DMG_HEADER_SZ = struct.calcsize(DMG_HEADER)
+DMG_HEADER_STRUCT = struct.Struct(DMG_HEADER)
 
 DMG_BLOCK_TABLE_MAGIC = b"mish"
 DMG_BLOCK_TABLE = ">4sIQQQIIIIIIIIII128sI"
 DMG_BLOCK_TABLE_MAGIC_SZ = len(DMG_BLOCK_TABLE_MAGIC)
 DMG_BLOCK_TABLE_SZ = struct.calcsize(DMG_BLOCK_TABLE)
+DMG_BLOCK_TABLE_STRUCT = struct.Struct(DMG_BLOCK_TABLE)
 
 DMG_BLOCK_CHUNK = ">I4sQQQQ"
 DMG_BLOCK_CHUNK_SZ = struct.calcsize(DMG_BLOCK_CHUNK)
+DMG_BLOCK_CHUNK_STRUCT = struct.Struct(DMG_BLOCK_CHUNK)
 
 DMGHeader = namedtuple(
     "DMGHeader",
@@ -96,6 +108,57 @@ DMGBlockChunk = namedtuple(
 )
 
 
+# Decompressors for compressed chunk types. 0x80000005 - Zlib, 0x80000006 - BZ2, and
+# 0x80000008 - LZMA.
+DMG_CHUNK_DECOMPRESSORS = {
+    0x80000005: isal_zlib.decompressobj if isal_zlib else zlib.decompressobj,
+    0x80000006: bz2.BZ2Decompressor,
+    0x80000008: lzma.LZMADecompressor,
+}
+
+
+def decompress(
+    fin: BinaryIO,
+    fout: BinaryIO,
+    decompressor: Union["zlib._Decompress", bz2.BZ2Decompressor, lzma.LZMADecompressor],
+    length: int,
+) -> None:
+    """Decompress a chunk from the current position of fin, writing it to fout.
+
+    Data is read and written in chunks to not balloon memory when processing large
+    chunks, and the output of each call is bounded to prevent a single read from
+    decompressing into a very large buffer. zlib returns input which did not fit into
+    the output as an unconsumed tail, while bz2 and lzma buffer it internally until
+    called again.
+    """
+    remaining = length
+
+    while remaining > 0 and not decompressor.eof:
+        compressed = fin.read(min(remaining, CHUNK_SIZE))
+        if not compressed:
+            break
+
+        remaining -= len(compressed)
+        fout.write(decompressor.decompress(compressed, CHUNK_SIZE))
+
+        while not decompressor.eof:
+            if isinstance(decompressor, (bz2.BZ2Decompressor, lzma.LZMADecompressor)):
+                if decompressor.needs_input:
+                    break
+                fout.write(decompressor.decompress(b"", CHUNK_SIZE))
+            else:
+                if not decompressor.unconsumed_tail:
+                    break
+                fout.write(
+                    decompressor.decompress(decompressor.unconsumed_tail, CHUNK_SIZE)
+                )
+
+    if not decompressor.eof:
+        raise InvalidFileException(
+            "Compressed data ended before the end-of-stream marker was reached"
+        )
+
+
 class DMGBlock(BaseModel, extra=Extra.forbid):
     """Expresses a DMG block entry and its chunks."""
 
@@ -121,7 +184,7 @@ class DMG:
                 # Rewind and attempt to read in header.
                 fin.seek(-DMG_HEADER_MAGIC_SZ, 1)
                 self._header = DMGHeader._make(
-                    struct.unpack(DMG_HEADER, fin.read(DMG_HEADER_SZ))
+                    DMG_HEADER_STRUCT.unpack(fin.read(DMG_HEADER_SZ))
                 )
 
                 # Read the XML property list.
@@ -140,20 +203,20 @@ class DMG:
             name = entry.get("Name")
 
             block = DMGBlock(name=name)
-            table = DMGBlockTable._make(
-                struct.unpack(DMG_BLOCK_TABLE, data[0:DMG_BLOCK_TABLE_SZ])
-            )
+            table = DMGBlockTable._make(DMG_BLOCK_TABLE_STRUCT.unpack_from(data))
 
             # Extract all blocks and their associated chunks from the encoded "Data"
-            # inside of the extracted plist.
+            # inside of the extracted plist. All chunks are unpacked in a single pass
+            # over a view of the chunk table, rather than one at a time.
             start = DMG_BLOCK_TABLE_SZ
+            end = start + table.chunk_count * DMG_BLOCK_CHUNK_SZ
 
-            for _ in range(0, table.chunk_count):
-                end = start + DMG_BLOCK_CHUNK_SZ
-                block.chunks.append(
-                    DMGBlockChunk._make(struct.unpack(DMG_BLOCK_CHUNK, data[start:end]))
+            block.chunks.extend(
+                map(
+                    DMGBlockChunk._make,
+                    DMG_BLOCK_CHUNK_STRUCT.iter_unpack(memoryview(data)[start:end]),
                 )
-                start = end
+            )
 
             candidates.append(block)
 
@@ -162,6 +225,7 @@ class DMG:
     def extract(self, destination):
         """Extract all blocks from the DMG to the optional destination directory."""
         parent = os.path.basename(self.archive)
+        codec = isal_zlib if isal_zlib else zlib
 
         try:
             os.makedirs(destination, exist_ok=True)
@@ -171,40 +235,42 @@ class DMG:
             )
 
         # Process each chunk inside of each block. A DMG has multiple blocks, and a
-        # block has N chunks.
-        for idx, block in enumerate(self._parse_blocks()):
-            output = os.path.join(destination, f"{parent}.{idx}.blob")
-
-            for chunk in block.chunks:
-                # Skip Ignored, Comment, and Last blocks (respectively).
-                if chunk.type in [0x00000002, 0x7FFFFFFE, 0xFFFFFFFF]:
-                    continue
-
-                try:
-                    with open(self.archive, "rb") as fin, open(output, "ab") as fout:
-                        fin.seek(chunk.compressed_offset)
-
-                        # 0x80000005 - Zlib.
-                        if chunk.type == 0x80000005:
-                            fout.write(
-                                zlib.decompress(fin.read(chunk.compressed_length))
-                            )
-
-                        # 0x80000005 - BZ2.
-                        if chunk.type == 0x80000006:
-                            fout.write(
-                                bz2.decompress(fin.read(chunk.compressed_length))
-                            )
-
-                        # 0x80000005 - LZMA.
-                        if chunk.type == 0x80000008:
-                            fout.write(
-                                lzma.decompress(fin.read(chunk.compressed_length))
-                            )
-
-                        # 0x00000000 - Zero Fill.
-                        if chunk.type == 0x00000000:
-                            fout.write(b"\x00" * chunk.compressed_length)
-                            continue
-                except (OSError, lzma.LZMAError, ValueError) as err:
-                    raise InvalidFileException(err)
+        # block has N chunks. The archive is opened once for all blocks, and each
+        # output once for all of its chunks, rather than both being opened per chunk.
+        try:
+            with open(self.archive, "rb") as fin:
+                for idx, block in enumerate(self._parse_blocks()):
+                    output = os.path.join(destination, f"{parent}.{idx}.blob")
+
+                    # Skip Ignored, Comment, and Last blocks (respectively).
+                    chunks = [
+                        chunk
+                        for chunk in block.chunks
+                        if chunk.type not in [0x00000002, 0x7FFFFFFE, 0xFFFFFFFF]
+                    ]
+                    if not chunks:
+                        continue
+
+                    with open(output, "ab") as fout:
+                        for chunk in chunks:
+                            fin.seek(chunk.compressed_offset)
+
+                            factory = DMG_CHUNK_DECOMPRESSORS.get(chunk.type)
+                            if factory:
+                                decompress(
+                                    fin, fout, factory(), chunk.compressed_length
+                                )
+
+                            # 0x00000000 - Zero Fill. The output is extended rather
+                            # than written to, leaving a sparse hole where supported
+                            # by the filesystem. As the output is opened for append,
+                            # subsequent writes will land after the hole.
+                            if chunk.type == 0x00000000:
+                                fout.flush()
+                                os.ftruncate(
+                                    fout.fileno(),
+                                    os.fstat(fout.fileno()).st_size
+                                    + chunk.compressed_length,
+                                )
+        except (OSError, lzma.LZMAError, codec.error, ValueError) as err:
+            raise InvalidFileException(err)
@@ -8,14 +8,22 @@ import struct
 import xml.etree.ElementTree as ET
 import zlib
 from collections import namedtuple
-from typing import List
+from typing import BinaryIO, List
 
 from stacs.scan.constants import CHUNK_SIZE
 from stacs.scan.exceptions import FileAccessException, InvalidFileException
 
+# python-isal provides a drop-in replacement for the zlib module, backed by Intel's
+# ISA-L, which decompresses considerably faster than zlib. It's used when installed.
+try:
+    from isal import isal_zlib
+except ImportError:
+    isal_zlib = None
+
 XAR_MAGIC = b"xar!"
 XAR_HEADER = ">4sHHQQI"
 XAR_HEADER_SZ = struct.calcsize(XAR_HEADER)
+XAR_HEADER_STRUCT = struct.Struct(XAR_HEADER)
 
 # via xar/include/xar.h.in
 XARHeader = namedtuple(
@@ -46,11 +54,38 @@ XAREntry = namedtuple(
 )
 
 
+def copy(fin: BinaryIO, fout: BinaryIO, offset: int, length: int):
+    """Copy length bytes from offset in fin to fout.
+
+    Data is copied by the kernel with sendfile where supported, to avoid reading all
+    data into Python only to write it back out. If sendfile is not available, or the
+    platform does not support file to file copies, the remainder is copied in chunks.
+    """
+    try:
+        while length > 0:
+            sent = os.sendfile(fout.fileno(), fin.fileno(), offset, length)
+            if sent == 0:
+                return
+
+            offset += sent
+            length -= sent
+        return
+    except (AttributeError, OSError):
+        pass
+
+    # Read all data in chunks to not balloon memory when processing large files.
+    fin.seek(offset)
+    while length > 0 and (chunk := fin.read(min(length, CHUNK_SIZE))):
+        fout.write(chunk)
+        length -= len(chunk)
+
+
 class XAR:
     """Provides an eXtensible ARchive Format parser and extrator."""
 
     def __init__(self, filepath: str):
         self.archive = filepath
+        codec = isal_zlib if isal_zlib else zlib
 
         try:
             with open(self.archive, "rb") as fin:
@@ -61,19 +96,15 @@ class XAR:
                 # Rewind and attempt to read in header.
                 fin.seek(0)
                 self._header = XARHeader._make(
-                    struct.unpack(XAR_HEADER, fin.read(XAR_HEADER_SZ))
+                    XAR_HEADER_STRUCT.unpack(fin.read(XAR_HEADER_SZ))
                 )
 
                 # Read and decompress the table-of-contents.
                 fin.seek(self._header.size)
 
-                self._toc = ET.fromstring(
-                    str(
-                        zlib.decompress(fin.read(self._header.toc_length_uncompressed)),
-                        "utf-8",
-                    )
-                )
-        except zlib.error as err:
+                toc = fin.read(self._header.toc_length_uncompressed)
+                self._toc = ET.fromstring(str(codec.decompress(toc), "utf-8"))
+        except codec.error as err:
             raise InvalidFileException(f"Unable to read table-of-contents: {err}")
         except OSError as err:
             raise FileAccessException(f"Unable to read archive: {err}")
@@ -83,22 +114,27 @@ class XAR:
         candidates = []
 
         # Strip any slashes, only using the last path component.
-        kind = root.find(".type").text
-        name = root.find(".name").text.split("/")[-1]
+        kind = root.findtext("type")
+        name = root.findtext("name").split("/")[-1]
         path = os.path.join(directory, name)
 
-        # Recurse for directories
+        # Recurse for directories. Only direct children are visited, as their own
+        # children are handled by the recursion.
         if kind == "directory":
-            for element in root.findall(".//file"):
+            for element in root.iterfind("file"):
                 candidates.extend(self._parse_entries(element, directory=path))
 
         if kind == "file":
-            size = int(root.find(".//data/size").text)
-            length = int(root.find(".//data/length").text)
-            offset = int(root.find(".//data/offset").text)
-            encoding = root.find(".//data/encoding").get("style")
-            archived_cksum = root.find(".//data/archived-checksum").text
-            archived_cksum_kind = root.find(".//data/archived-checksum").get("style")
+            # The ToC schema is fixed, so fields are looked up as direct children of the
+            # data element, rather than searching all descendants for each.
+            data = root.find("data")
+            size = int(data.findtext("size"))
+            length = int(data.findtext("length"))
+            offset = int(data.findtext("offset"))
+            encoding = data.find("encoding").get("style")
+            checksum = data.find("archived-checksum")
+            archived_cksum = checksum.text
+            archived_cksum_kind = checksum.get("style")
 
             candidates.append(
                 XAREntry(
@@ -120,7 +156,7 @@ class XAR:
         """Return a list of entries in this XAR."""
         candidates = []
 
-        for entry in self._toc.findall("./toc/file"):
+        for entry in self._toc.iterfind("toc/file"):
             candidates.extend(self._parse_entries(entry))
 
         return candidates
@@ -130,48 +166,60 @@ class XAR:
         # Offset must be adjusted by the size of the ToC and the header. This is as the
         # offset is from the first byte AFTER the header and compressed ToC.
         header_size = self._header.size + self._header.toc_length_compressed
+        codec = isal_zlib if isal_zlib else zlib
 
-        for entry in self.entries():
-            parent = os.path.dirname(os.path.join(destination, entry.path))
+        # The archive is opened once for all entries, rather than once per entry.
+        try:
+            with open(self.archive, "rb") as fin:
+                for entry in self.entries():
+                    self._extract_entry(fin, entry, destination, header_size, codec)
+        except (OSError, codec.error) as err:
+            raise InvalidFileException(err)
 
-            try:
-                os.makedirs(parent, exist_ok=True)
-            except OSError as err:
-                raise FileAccessException(
-                    f"Unable to create directory during extraction: {err}"
-                )
+    def _extract_entry(self, fin, entry, destination, header_size, codec):
+        """Extract a single entry from the open XAR to the destination directory."""
+        parent = os.path.dirname(os.path.join(destination, entry.path))
+
+        try:
+            os.makedirs(parent, exist_ok=True)
+        except OSError as err:
+            raise FileAccessException(
+                f"Unable to create directory during extraction: {err}"
+            )
 
-            # Check whether a decompressor should be used.
-            decompressor = None
-
-            if entry.encoding == "application/x-gzip":
-                decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 32).decompress
-
-            # Perform extraction.
-            # TODO: No decompression or integrity checking is performed today, nor are
-            # ownership and modes followed.
-            remaining = entry.length
-
-            try:
-                with open(self.archive, "rb") as fin:
-                    with open(os.path.join(destination, entry.path), "wb") as fout:
-                        fin.seek(header_size + entry.offset)
-
-                        # Read all data in chunks to not balloon memory when processing
-                        # large files.
-                        while remaining > 0:
-                            delta = remaining - CHUNK_SIZE
-                            if delta < 0:
-                                read_length = remaining
-                            else:
-                                read_length = CHUNK_SIZE
-
-                            # Use a decompressor, if required.
-                            if decompressor:
-                                fout.write(decompressor(fin.read(read_length)))
-                            else:
-                                fout.write(fin.read(read_length))
-
-                            remaining -= read_length
-            except (OSError, zlib.error) as err:
-                raise InvalidFileException(err)
+        # Check whether a decompressor should be used.
+        decompressor = None
+
+        if entry.encoding == "application/x-gzip":
+            decompressor = codec.decompressobj(wbits=codec.MAX_WBITS | 32)
+
+        # Perform extraction.
+        # TODO: No decompression or integrity checking is performed today, nor are
+        # ownership and modes followed.
+        remaining = entry.length
+
+        with open(os.path.join(destination, entry.path), "wb") as fout:
+            # Entries without an encoding are copied as-is.
+            if not decompressor:
+                copy(fin, fout, header_size + entry.offset, entry.length)
+                return
+
+            fin.seek(header_size + entry.offset)
+
+            # Read all data in chunks to not balloon memory when processing large
+            # files. Reads are already the size of a chunk, so aren't buffered further.
+            while remaining > 0:
+                delta = remaining - CHUNK_SIZE
+                if delta < 0:
+                    read_length = remaining
+                else:
+                    read_length = CHUNK_SIZE
+
+                # The output of each call is bounded to prevent a single chunk from
+                # decompressing into a very large buffer.
+                compressed = fin.read(read_length)
+                while compressed:
+                    fout.write(decompressor.decompress(compressed, CHUNK_SIZE))
+                    compressed = decompressor.unconsumed_tail
+
+                remaining -= read_length
@@ -3,9 +3,11 @@
 SPDX-License-Identifier: BSD-3-Clause
 """
 
+import base64
+import sys
 from typing import List
 
-from pydantic import BaseModel, Extra, Field
+from pydantic import BaseModel, Extra, Field, validator
 
 
 class Location(BaseModel, extra=Extra.forbid):
@@ -43,6 +45,11 @@ class Source(BaseModel, extra=Extra.forbid):
         title="The version of the element which generated the finding.",
     )
 
+    @validator("module", "reference")
+    def intern_identifiers(cls, value):
+        """Intern module and reference names, as there are few distinct values."""
+        return sys.intern(value)
+
 
 class Sample(BaseModel, extra=Extra.forbid):
     """The content and context of a finding."""
@@ -62,6 +69,31 @@ class Sample(BaseModel, extra=Extra.forbid):
     binary: bool = Field(
         title="Indicates that the finding was binary and is base64 encoded."
     )
+    context: str = Field(
+        None,
+        title=(
+            "The contents of the finding, including the bytes before and after. Base64 "
+            "encoded as a whole if binary."
+        ),
+    )
+
+    @validator("context", always=True)
+    def generate_context(cls, value, values):
+        """Generate the context from the sample, if not provided."""
+        if value is not None or not {"before", "finding", "after"} <= values.keys():
+            return value
+
+        if values.get("binary"):
+            return str(
+                base64.b64encode(
+                    base64.b64decode(values["before"])
+                    + base64.b64decode(values["finding"])
+                    + base64.b64decode(values["after"])
+                ),
+                "utf-8",
+            )
+
+        return values["before"] + values["finding"] + values["after"]
 
 
 class Ignore(BaseModel, extra=Extra.forbid):
@@ -5,11 +5,17 @@ SPDX-License-Identifier: BSD-3-Clause
 
 import json
 import os
-from typing import List
+import sys
+from typing import List, Set
 
 from pydantic import BaseModel, Extra, Field, validator
 from stacs.scan.exceptions import IgnoreListException, STACSException
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class Entry(BaseModel, extra=Extra.forbid):
     """Defines the schema of an ignore."""
@@ -57,6 +63,16 @@ class Entry(BaseModel, extra=Extra.forbid):
 
         return value
 
+    @validator("module", always=True)
+    def intern_module(cls, value):
+        """Intern the module name, as findings are matched against it."""
+        return sys.intern(value)
+
+    @validator("references", each_item=True)
+    def intern_references(cls, value):
+        """Intern references, as findings are matched against them."""
+        return sys.intern(value)
+
     @validator("offset", always=True)
     def offset_and_refernces_both_set(cls, value, values):
         if value and len(values.get("references")) > 0:
@@ -82,13 +98,35 @@ class Format(BaseModel, extra=Extra.forbid):
 
 def from_file(filename: str) -> Format:
     """Load an ignore list from file, returning a rendered down and complete list."""
+    return _from_file(filename, set())
+
+
+def _from_file(filename: str, loaded: Set[str]) -> Format:
+    """Load an ignore list from file, skipping any lists which have already been loaded.
+
+    Ignore lists are tracked by their real path, so a list included more than once is
+    only read and validated once, and include cycles terminate.
+    """
     parent_file = os.path.abspath(os.path.expanduser(filename))
     parent_path = os.path.dirname(parent_file)
 
+    canonical = os.path.realpath(parent_file)
+    if canonical in loaded:
+        return Format()
+
+    loaded.add(canonical)
+
     # Load the parent ignore list, and then recurse as needed to handle includes.
     try:
-        with open(parent_file, "r") as fin:
-            parent_list = Format(**json.load(fin))
+        # orjson is used to parse ignore lists if installed, as it is considerably
+        # faster than the standard library.
+        with open(parent_file, "rb") as fin:
+            content = fin.read()
+
+        if orjson is not None:
+            parent_list = Format(**orjson.loads(content))
+        else:
+            parent_list = Format(**json.loads(content))
 
         # Roll over the include list and replace all entries with a fully qualified,
         # path, if not already set.
@@ -101,7 +139,7 @@ def from_file(filename: str) -> Format:
 
     # Recursively load included ignore lists.
     for file in parent_list.include:
-        child_pack = from_file(file)
+        child_pack = _from_file(file, loaded)
         parent_list.ignore.extend(child_pack.ignore)
 
     # Finally strip the included ignore lists from the entry, as these have been
@@ -5,11 +5,16 @@ SPDX-License-Identifier: BSD-3-Clause
 
 import json
 import os
-from typing import List
+from typing import List, Set
 
 from pydantic import BaseModel, Extra, Field
 from stacs.scan.exceptions import STACSException
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class Entry(BaseModel, extra=Extra.forbid):
     """Defines the schema of an allow."""
@@ -39,31 +44,54 @@ class Format(BaseModel, extra=Extra.forbid):
 
 def from_file(filename: str) -> Format:
     """Load a pack from file, returning a rendered down and complete pack."""
+    return _from_file(filename, set())
+
+
+def _from_file(filename: str, loaded: Set[str]) -> Format:
+    """Load a pack from file, skipping any packs which have already been loaded.
+
+    Packs are tracked by their real path, so a pack included more than once - such as
+    via two different parents - is only read and validated once, and include cycles
+    terminate.
+    """
     parent_file = os.path.abspath(os.path.expanduser(filename))
     parent_path = os.path.dirname(parent_file)
 
+    canonical = os.path.realpath(parent_file)
+    if canonical in loaded:
+        return Format()
+
+    loaded.add(canonical)
+
     # Load the parent pack, and then recurse as needed to handle includes.
     try:
-        with open(parent_file, "r") as fin:
-            parent_pack = Format(**json.load(fin))
+        # orjson is used to parse packs if installed, as it is considerably faster
+        # than the standard library. Both accept raw bytes, and orjson's decode error
+        # is a subclass of the standard library's.
+        with open(parent_file, "rb") as fin:
+            content = fin.read()
 
-        # Roll over the pack and ensure any entries are fully qualified.
+        if orjson is not None:
+            parent_pack = Format(**orjson.loads(content))
+        else:
+            parent_pack = Format(**json.loads(content))
+
+        # Roll over the pack and ensure any entries are fully qualified. Joining an
+        # absolute path onto the parent path returns the absolute path unchanged, so
+        # only relative paths are resolved against the parent.
         for entry in parent_pack.pack:
-            entry.path = os.path.expanduser(entry.path)
-            if not entry.path.startswith("/"):
-                # Resolve and update the path.
-                entry.path = os.path.join(parent_path, entry.path)
-        # Roll over the include list and replace all entries with a fully qualified
-        # path, if not already set.
-        for index, path in enumerate(parent_pack.include):
-            if not path.startswith("/"):
-                parent_pack.include[index] = os.path.join(parent_path, path)
+            entry.path = os.path.join(parent_path, os.path.expanduser(entry.path))
+
+        # Replace the include list with fully qualified paths in a single pass.
+        parent_pack.include = [
+            os.path.join(parent_path, path) for path in parent_pack.include
+        ]
     except (OSError, json.JSONDecodeError) as err:
         raise STACSException(err)
 
     # Recursively load included packs, adding results to the loaded pack.
     for file in parent_pack.include:
-        child_pack = from_file(file)
+        child_pack = _from_file(file, loaded)
         parent_pack.pack.extend(child_pack.pack)
 
     # Finally strip the included packs from the entry, as these have been resolved,
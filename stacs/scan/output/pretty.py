@@ -1,4 +1,3 @@
-import base64
 from typing import List
 
 from colorama import Fore, init
@@ -28,17 +27,9 @@ def generate_file_tree(virtual_path: str) -> str:
 
 def generate_sample(sample: Sample):
     """Return a plain-text and text formatted sample."""
-    # Ensure the sample is nicely base64 encoded if binary, rather than slapping three
-    # already base64'd strings together.
-    raw = bytearray()
-    if sample.binary:
-        raw.extend(bytearray(base64.b64decode(sample.before)))
-        raw.extend(bytearray(base64.b64decode(sample.finding)))
-        raw.extend(bytearray(base64.b64decode(sample.after)))
-
-        return str(base64.b64encode(raw), "utf-8")
-
-    return "".join([sample.before, sample.finding, sample.after])
+    # The context is already a single base64 encoded string if binary, rather than
+    # three already base64'd strings slapped together.
+    return sample.context
 
 
 def render(findings: List[model.finding.Entry], pack: model.pack.Format) -> str:
@@ -54,35 +45,14 @@ def render(findings: List[model.finding.Entry], pack: model.pack.Format) -> str:
         if finding.ignore is not None and finding.ignore.ignored:
             continue
 
-        # Track it.
+        # Track it. Strings for presentation are only generated when printed.
         unsuppressed += 1
-
-        if results.get(finding.path) is None:
-            results[finding.path] = []
-
-        # Extract location appropriately.
-        location = None
-        if finding.location.line:
-            location = f"line {finding.location.line}"
-        else:
-            location = f"{finding.location.offset}-bytes"
-
-        # Generates all strings for presentation right away.
-        results[finding.path].append(
-            {
-                "tree": generate_file_tree(finding.path),
-                "path": finding.path.split(ARCHIVE_FILE_SEPARATOR)[-1],
-                "rule": finding.source.reference,
-                "text": finding.source.description,
-                "location": location,
-                "sample": generate_sample(finding.sample),
-            }
-        )
+        results.setdefault(finding.path, []).append(finding)
 
     # Provide a summary.
     print(helper.banner(version=__version__))
 
-    if findings == 0:
+    if unsuppressed == 0:
         print("✨ " + Fore.GREEN + "No unsuppressed findings! Great work! ✨\n")
         return
 
@@ -96,25 +66,34 @@ def render(findings: List[model.finding.Entry], pack: model.pack.Format) -> str:
         filepath = candidate.split(ARCHIVE_FILE_SEPARATOR)[0]
         count = len(results[candidate])
 
+        # All findings for a file share the same tree, so it's only generated once.
+        tree = generate_file_tree(candidate)
+
         if ARCHIVE_FILE_SEPARATOR in candidate:
             print(f"{Fore.RED}❌ {count} finding(s) inside of file {filepath} (Nested)")
         else:
             print(f"{Fore.RED}❌ {count} finding(s) inside of file {filepath}")
 
         for finding in results[candidate]:
+            # Extract location appropriately.
+            if finding.location.line:
+                location = f"line {finding.location.line}"
+            else:
+                location = f"{finding.location.offset}-bytes"
+
             print()
-            helper.printi(f"{Fore.YELLOW}Reason   : {finding['text']}")
-            helper.printi(f"{Fore.YELLOW}Rule Id  : {finding['rule']}")
-            helper.printi(f"{Fore.YELLOW}Location : {finding['location']}\n\n")
+            helper.printi(f"{Fore.YELLOW}Reason   : {finding.source.description}")
+            helper.printi(f"{Fore.YELLOW}Rule Id  : {finding.source.reference}")
+            helper.printi(f"{Fore.YELLOW}Location : {location}\n\n")
             helper.printi(f"{Fore.YELLOW}Filetree:\n\n")
             helper.printi(
-                finding["tree"],
+                tree,
                 prefix=f"    {Fore.RESET}|{Fore.BLUE}",
             )
             print()
             helper.printi(f"{Fore.YELLOW}Sample:\n\n")
             helper.printi(
-                f"... {finding['sample']} ...",
+                f"... {generate_sample(finding.sample)} ...",
                 prefix=f"    {Fore.RESET}|{Fore.BLUE}",
             )
             print()
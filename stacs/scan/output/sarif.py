@@ -3,14 +3,19 @@
 SPDX-License-Identifier: BSD-3-Clause
 """
 
-import base64
+import functools
+import io
 import json
-import re
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, TextIO, Tuple
 
 from stacs.scan import __about__, model
 from stacs.scan.constants import ARCHIVE_FILE_SEPARATOR
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Only one SARIF version will be supported at a time.
 SARIF_VERSION = "2.1.0"
 SARIF_SCHEMA_URI = "https://schemastore.azurewebsites.net/schemas/json/sarif-2.1.0.json"
@@ -25,6 +30,24 @@ def confidence_to_level(confidence: int) -> str:
         return "error"
 
 
+def strip_root(path: str, root: str) -> str:
+    """Strips the scan directory root, and any leading slashes, from the path."""
+    if path.startswith(root):
+        path = path[len(root) :]
+
+    return path.lstrip("/")
+
+
+@functools.lru_cache(maxsize=4096)
+def split_path(path: str, root: str) -> Tuple[str, ...]:
+    """Splits a finding path into its archive members, relative to the scan root.
+
+    Findings in the same file share a path, and are usually reported together, so the
+    result is cached to avoid splitting the same path for every finding.
+    """
+    return tuple(strip_root(part, root) for part in path.split(ARCHIVE_FILE_SEPARATOR))
+
+
 def render_artifact(path: str, parent: Optional[int] = None) -> Dict[str, Any]:
     """Create a new artifact entry."""
     artifact = {
@@ -40,51 +63,36 @@ def render_artifact(path: str, parent: Optional[int] = None) -> Dict[str, Any]:
     return artifact
 
 
-def path_in_artifacts(path: str, artifacts: List[Dict[str, Any]], parent) -> int:
-    """Checks if a path exists in the artifacts list."""
-    for index, artifact in enumerate(artifacts):
-        if path == artifact["location"]["uri"]:
-            # Short circuit if we both don't have a parent.
-            if artifact.get("parentIndex", None) is None and parent is None:
-                return index
-
-            # Check common ancestry.
-            try:
-                their_parent = artifact.get("parentIndex", None)
-                our_parent = parent
-
-                while True:
-                    if our_parent == their_parent:
-                        their_parent = artifacts[their_parent]["parentIndex"]
-                        our_parent = artifacts[our_parent]["parentIndex"]
-                    else:
-                        break
-            except KeyError:
-                # We're good all the way back to the root.
-                return index
-
-    return None
-
-
 def add_artifact(
     root: str,
     finding: model.finding.Entry,
     artifacts: List[Dict[str, Any]],
+    lookup: Optional[Dict[Tuple[str, Optional[int]], int]] = None,
 ) -> Tuple[int, List[Dict[str, Any]]]:
-    """Generates SARIF artifact entires for findings (SARIF v2.1.0 Section 3.24)."""
-    parent = None
+    """Generates SARIF artifact entires for findings (SARIF v2.1.0 Section 3.24).
+
+    Artifacts are unique by their path and parent, so existing artifacts are found via a
+    lookup keyed on both. This lookup should be reused across calls, and is updated as
+    artifacts are added. If not provided, it is built from the existing artifacts.
+    """
+    if lookup is None:
+        lookup = {}
+        for index, artifact in enumerate(artifacts):
+            key = (artifact["location"]["uri"], artifact.get("parentIndex"))
+            lookup.setdefault(key, index)
 
-    for real_path in finding.path.split(ARCHIVE_FILE_SEPARATOR):
-        # Strip the scan directory root from the path for Base URIs to work properly.
-        path = re.sub(rf"^{root}", "", real_path).lstrip("/")
+    parent = None
 
+    # The scan directory root is stripped from the path for Base URIs to work properly.
+    for path in split_path(finding.path, root):
         # Check if the path already exists.
-        new_parent = path_in_artifacts(path, artifacts, parent)
-        if new_parent is not None:
-            parent = new_parent
+        existing = lookup.get((path, parent))
+        if existing is not None:
+            parent = existing
             continue
 
         artifacts.append(render_artifact(path, parent))
+        lookup[(path, parent)] = len(artifacts) - 1
         parent = len(artifacts) - 1
 
     # Add metadata to this entry, if missing.
@@ -94,16 +102,56 @@ def add_artifact(
     return (parent, artifacts)
 
 
+def dumps(value: Any) -> str:
+    """Returns a compact JSON representation of the provided value.
+
+    orjson is used to serialise values if installed, as it is considerably faster than
+    the standard library. However, it rejects strings containing surrogates - such as
+    file paths which are not valid UTF-8 - which the standard library escapes instead.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value).decode("utf-8")
+        except orjson.JSONEncodeError:
+            pass
+
+    return json.dumps(value, separators=(",", ":"))
+
+
 def render(
     root: str, findings: List[model.finding.Entry], pack: model.pack.Format
 ) -> str:
     """Renders down a SARIF document for STACS findings."""
+    output = io.StringIO()
+    write(root, findings, pack, output)
+
+    return output.getvalue()
+
+
+def write(
+    root: str,
+    findings: List[model.finding.Entry],
+    pack: model.pack.Format,
+    output: TextIO,
+) -> None:
+    """Writes a SARIF document for STACS findings to the provided output.
+
+    Results are written out as they are generated, rather than building the entire
+    document in memory before serialising it. As the tool and artifacts are only known
+    once all results have been generated, these are written after the results.
+    """
     rules = []
-    results = []
+    rules_by_id = {}
     artifacts = []
+    lookup = {}
+
+    output.write(
+        f'{{"version":{dumps(SARIF_VERSION)},"$schema":{dumps(SARIF_SCHEMA_URI)},'
+        '"runs":[{"results":['
+    )
 
     # Generate a result (SARIF v2.1.0 Section 3.27) for each finding.
-    for finding in findings:
+    for position, finding in enumerate(findings):
         # Suppressions (SARIF v2.1.0 Section 3.27.23) are used to track findings where
         # there is an "ignore" set - via ignore list.
         suppressions = []
@@ -115,21 +163,10 @@ def render(
 
         if finding.sample.binary:
             artifact_content["binary"] = finding.sample.finding
-            # Unencode and then re-encode the sample into a single B64 string to provide
-            # context.
-            context_content["binary"] = str(
-                base64.b64encode(
-                    base64.b64decode(finding.sample.before)
-                    + base64.b64decode(finding.sample.finding)
-                    + base64.b64decode(finding.sample.after)
-                ),
-                "utf-8",
-            )
+            context_content["binary"] = finding.sample.context
         else:
             artifact_content["text"] = finding.sample.finding
-            context_content["text"] = (
-                finding.sample.before + finding.sample.finding + finding.sample.after
-            )
+            context_content["text"] = finding.sample.context
 
         # Create a new contextRegion (SARIF v2.1.0 Section 3.29.5) to provide contextual
         # information about the finding, but do not include the byte or line number
@@ -148,12 +185,11 @@ def render(
             region["startLine"] = finding.location.line
 
         # Add a new artifact for this finding, or retrieve the location of the existing.
-        index, artifacts = add_artifact(root, finding, artifacts)
+        index, artifacts = add_artifact(root, finding, artifacts, lookup)
 
         # Strip the scan directory root from the path, as the we're using the reference
         # from originalUriBaseIds (SARIF v2.1.0 Section 3.14.14) to allow "portability".
-        path = finding.path.split(ARCHIVE_FILE_SEPARATOR)[-1]
-        relative_path = re.sub(rf"^{root}", "", path).lstrip("/")
+        relative_path = split_path(finding.path, root)[-1]
 
         # Pin the artifact location back to a physical location (SARIF v2.1.0 Section
         # 3.28.3).
@@ -170,12 +206,7 @@ def render(
         }
 
         # Generate a new Rule entry, if required (SARIF v2.1.0 Section 3.49).
-        rule = None
-
-        for candidate in rules:
-            if finding.source.reference == candidate.get("id"):
-                rule = candidate
-                break
+        rule = rules_by_id.get(finding.source.reference)
 
         if not rule:
             # Add the description from the original rule pack entry into the Rule for
@@ -187,6 +218,7 @@ def render(
                 },
             }
             rules.append(rule)
+            rules_by_id[finding.source.reference] = rule
 
         # Add a Suppression entry if this finding was marked as "Ignored", along with
         # the reason (justification) from the original ignore list.
@@ -199,20 +231,25 @@ def render(
                 }
             )
 
-        # Track the finding (Result).
-        results.append(
-            {
-                "message": rule.get("shortDescription"),
-                "level": confidence_to_level(finding.confidence),
-                "ruleId": finding.source.reference,
-                "locations": [
-                    physical_location,
-                ],
-                "suppressions": suppressions,
-            }
+        # Write out the finding (Result).
+        if position > 0:
+            output.write(",")
+
+        output.write(
+            dumps(
+                {
+                    "message": rule.get("shortDescription"),
+                    "level": confidence_to_level(finding.confidence),
+                    "ruleId": finding.source.reference,
+                    "locations": [
+                        physical_location,
+                    ],
+                    "suppressions": suppressions,
+                }
+            )
         )
 
-    # Add a toolComponent (SARIF v2.1.0 Section 3.19), and bolt it all together.
+    # Add a toolComponent (SARIF v2.1.0 Section 3.19).
     tool = {
         "driver": {
             "name": __about__.__title__.upper(),
@@ -222,23 +259,14 @@ def render(
             "informationUri": __about__.__uri__,
         },
     }
-    run = {
-        "tool": tool,
-        "results": results,
-        "artifacts": artifacts,
-        "originalUriBaseIds": {
-            SARIF_URI_BASE_ID: {
-                "uri": f"file://{root.rstrip('/')}/",
-            },
+    base = {
+        SARIF_URI_BASE_ID: {
+            "uri": f"file://{root.rstrip('/')}/",
         },
     }
-    sarif = {
-        "version": SARIF_VERSION,
-        "$schema": SARIF_SCHEMA_URI,
-        "runs": [
-            run,
-        ],
-    }
 
-    # Return a stringified JSON representation of the SARIF document.
-    return json.dumps(sarif)
+    # Bolt it all together.
+    output.write(
+        f'],"tool":{dumps(tool)},"artifacts":{dumps(artifacts)},'
+        f'"originalUriBaseIds":{dumps(base)}}}]}}'
+    )
@@ -9,3 +9,6 @@ from stacs.scan.scanner import rules
 __all__ = [
     "rules",
 ]
+
+# All enabled scanner modules, in the same order as exported.
+MODULES = (rules,)
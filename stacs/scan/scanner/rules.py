@@ -7,7 +7,7 @@ import base64
 import hashlib
 import os
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List
+from typing import BinaryIO, Dict, Iterable, List, Tuple
 
 import yara
 
@@ -32,11 +32,10 @@ def is_binary(target: manifest.Entry) -> bool:
         return True
 
     # Otherwise, we'll try and read some data as text and see. This could fail if a
-    # binary contained readable text for 10 * CHUNK_SIZE.
+    # binary contained readable text for CHUNK_SIZE.
     try:
         with open(target.path, "r") as fin:
-            for _ in range(0, 10):
-                fin.read(CHUNK_SIZE)
+            fin.read(CHUNK_SIZE)
     except UnicodeDecodeError:
         return True
 
@@ -44,132 +43,181 @@ def is_binary(target: manifest.Entry) -> bool:
     return False
 
 
-def generate_sample(target: manifest.Entry, offset: int, size: int) -> finding.Sample:
-    """Generates a sample for a finding."""
-    binary = is_binary(target)
+def read_sample(fin: BinaryIO, offset: int, size: int) -> Tuple[bytes, bytes, bytes]:
+    """Reads the context before, the match itself, and the context after a finding."""
+    # Make sure we don't try and read past the beginning of the file. There's no need to
+    # check the end of the file, as the read will simply be short there instead.
+    if offset - WINDOW_SIZE < 0:
+        before_sz = offset
+    else:
+        before_sz = WINDOW_SIZE
+
+    # The context before, the finding match itself, and the context after are
+    # contiguous, so are read in a single pass and then split. We have the match already
+    # from yara, but we're already here so we may as well. Ensure we read N bytes AFTER
+    # the entire match, not after the first byte of the match.
+    fin.seek(offset - before_sz)
+    sample = fin.read(before_sz + size + WINDOW_SIZE)
+
+    return (
+        sample[:before_sz],
+        sample[before_sz : before_sz + size],
+        sample[before_sz + size :],
+    )
 
-    before = bytes()
-    after = bytes()
-    entry = bytes()
 
-    try:
-        # Make sure we don't try and read past the beginning and end of the file.
-        target_sz = os.stat(target.path).st_size
+def generate_sample(
+    target: manifest.Entry,
+    offset: int,
+    size: int,
+    binary: bool = None,
+    fin: BinaryIO = None,
+) -> finding.Sample:
+    """Generates a sample for a finding.
 
-        if offset - WINDOW_SIZE < 0:
-            before_sz = offset
-            before_offset = 0
-        else:
-            before_sz = WINDOW_SIZE
-            before_offset = offset - before_sz
-
-        # Ensure we read N bytes AFTER the entire match, not after the first byte of the
-        # match.
-        if offset + size + WINDOW_SIZE > target_sz:
-            after_sz = target_sz - (offset + size)
-            after_offset = target_sz - after_sz
-        else:
-            after_sz = WINDOW_SIZE
-            after_offset = offset + size
+    Whether the target is binary is determined if not provided. If an open handle to the
+    target is provided, it is used rather than opening the target again.
+    """
+    if binary is None:
+        binary = is_binary(target)
 
-        with open(target.path, "rb") as fin:
-            # Seek to and read in the context before.
-            fin.seek(before_offset)
-            before = fin.read(before_sz)
-
-            # Read the finding match itself. We have this already from yara, but we're
-            # already here so we may as well.
-            fin.seek(offset)
-            entry = fin.read(size)
-
-            # Seek to and read in the context after the finding.
-            fin.seek(after_offset)
-            after = fin.read(after_sz)
+    try:
+        if fin is not None:
+            (before, entry, after) = read_sample(fin, offset, size)
+        else:
+            with open(target.path, "rb") as handle:
+                (before, entry, after) = read_sample(handle, offset, size)
     except OSError as err:
         raise FileAccessException(err)
 
+    # Samples are constructed without validation, as all fields are generated here and
+    # already have the correct types. The context is generated here too, while the raw
+    # bytes are at hand, rather than being reassembled from the encoded fields later.
     if not binary:
         try:
-            return finding.Sample(
+            return finding.Sample.construct(
                 window=WINDOW_SIZE,
                 before=str(before, "utf-8"),
                 after=str(after, "utf-8"),
                 finding=str(entry, "utf-8"),
                 binary=binary,
+                context=str(before + entry + after, "utf-8"),
             )
         except UnicodeDecodeError:
             # Fall through and return a base64 encoded sample.
             pass
 
-    return finding.Sample(
+    return finding.Sample.construct(
         window=WINDOW_SIZE,
-        before=base64.b64encode(before),
-        after=base64.b64encode(after),
-        finding=base64.b64encode(entry),
+        before=str(base64.b64encode(before), "utf-8"),
+        after=str(base64.b64encode(after), "utf-8"),
+        finding=str(base64.b64encode(entry), "utf-8"),
         binary=binary,
+        context=str(base64.b64encode(before + entry + after), "utf-8"),
     )
 
 
-def generate_location(target: manifest.Entry, offset: int) -> finding.Location:
-    """Generates a location for a finding."""
+def generate_locations(
+    target: manifest.Entry, offsets: Iterable[int], binary: bool = None
+) -> Dict[int, finding.Location]:
+    """Generates locations for all findings in a file, keyed by their offset.
+
+    Whether the target is binary is determined if not provided.
+    """
+    if binary is None:
+        binary = is_binary(target)
+
     # If the file is binary, we can't generate a line number so we already have the data
     # we need.
-    if is_binary(target):
-        return finding.Location(offset=offset)
+    if binary:
+        return {offset: finding.Location.construct(offset=offset) for offset in offsets}
 
-    # Attempt to generate a line number for the finding.
-    bytes_read = 0
+    # Attempt to generate line numbers for the findings. Offsets are in bytes, so
+    # newlines are counted over the raw bytes in chunks. This is done in a single pass
+    # over the file, counting from each finding up to the next.
+    locations = {}
     line_number = 1
+    position = 0
     try:
-        with open(target.path, "r") as fin:
-            # Read in chunks, counting the number of newline characters up to the chunk
-            # which includes the finding.
-            while bytes_read < offset:
-                bytes_read += CHUNK_SIZE
-
-                if bytes_read > offset:
-                    line_number += fin.read(offset).count("\n")
-                else:
-                    line_number += fin.read(CHUNK_SIZE).count("\n")
-    except UnicodeDecodeError:
-        # It's possible to get into a state where the detected mime-type of a file is
-        # incorrect, resulting in unprocessable binary data making it here. In these
-        # cases we'll just bail early and report the number of bytes into the file of
-        # the finding. Exactly as we do for known binary files.
-        return finding.Location(offset=offset)
+        with open(target.path, "rb") as fin:
+            for offset in sorted(set(offsets)):
+                while position < offset:
+                    chunk = fin.read(min(offset - position, CHUNK_SIZE))
+                    if not chunk:
+                        break
+
+                    line_number += chunk.count(b"\n")
+                    position += len(chunk)
+
+                locations[offset] = finding.Location.construct(
+                    offset=offset, line=line_number
+                )
     except OSError as err:
         raise FileAccessException(err)
 
-    return finding.Location(offset=offset, line=line_number)
+    return locations
 
 
-def generate_findings(target: manifest.Entry, match: yara.Match) -> List[finding.Entry]:
-    """Attempts to create findings based on matches inside of the target file."""
+def generate_location(
+    target: manifest.Entry, offset: int, binary: bool = None
+) -> finding.Location:
+    """Generates a location for a finding.
+
+    Whether the target is binary is determined if not provided.
+    """
+    return generate_locations(target, [offset], binary)[offset]
+
+
+def generate_findings(
+    target: manifest.Entry,
+    match: yara.Match,
+    binary: bool = None,
+    locations: Dict[int, finding.Location] = None,
+    fin: BinaryIO = None,
+) -> List[finding.Entry]:
+    """Attempts to create findings based on matches inside of the target file.
+
+    Locations of findings, and an open handle to the target to read samples from, may
+    be provided to avoid reading through the target again for every match.
+    """
     findings = []
 
+    # Determine whether the target is binary, and the location of all findings, once for
+    # all findings rather than reading the file again for every finding.
+    if binary is None:
+        binary = is_binary(target)
+
+    if locations is None:
+        offsets = (offset for offset, _, _ in match.strings)
+        locations = generate_locations(target, offsets, binary)
+
+    # Add on information about the origin of the finding (that's us!) This is the same
+    # for every string matched by a rule, so it's generated once and shared between all
+    # findings for this match. Unlike the rest of the finding, this is validated, as
+    # rule metadata may not be of the expected type - such as an integer version.
+    source = finding.Source(
+        module=__name__,
+        reference=match.rule,
+        tags=match.tags,
+        version=match.meta.get("version", "UNKNOWN"),
+        description=match.meta.get("description"),
+    )
+    confidence = float(match.meta.get("accuracy", 50))
+    path = target.overlay if target.overlay else target.path
+
     # Generate a new finding entry for each matched string. This is in order to ensure
     # that multiple findings in the same file are listed separately - as they may be
-    # different credentials.
+    # different credentials. As there may be a large number of findings, and the data
+    # is generated by STACS, findings are constructed without validation.
     for offset, _, entry in match.strings:
-        location = generate_location(target, offset)
-        sample = generate_sample(target, offset, len(entry))
-
-        # Add on information about the origin of the finding (that's us!)
-        source = finding.Source(
-            module=__name__,
-            reference=match.rule,
-            tags=match.tags,
-            version=match.meta.get("version", "UNKNOWN"),
-            description=match.meta.get("description"),
-        )
         findings.append(
-            finding.Entry(
+            finding.Entry.construct(
                 md5=target.md5,
-                path=target.overlay if target.overlay else target.path,
-                confidence=match.meta.get("accuracy", 50),
+                path=path,
+                confidence=confidence,
                 source=source,
-                sample=sample,
-                location=location,
+                sample=generate_sample(target, offset, len(entry), binary, fin),
+                location=locations[offset],
             )
         )
 
@@ -179,21 +227,83 @@ def generate_findings(target: manifest.Entry, match: yara.Match) -> List[finding
 def matcher(target: manifest.Entry, ruleset: yara.Rules) -> List[finding.Entry]:
     findings = []
 
-    for match in ruleset.match(target.path):
-        findings.extend(generate_findings(target, match))
+    matches = ruleset.match(target.path)
+    if not matches:
+        return findings
+
+    # Whether the target is binary, and the location of findings, are only determined
+    # when there are findings, and then only once for all matches. Samples for all
+    # matches are read from a single handle to the target.
+    binary = is_binary(target)
+    offsets = (offset for match in matches for offset, _, _ in match.strings)
+    locations = generate_locations(target, offsets, binary)
+
+    try:
+        with open(target.path, "rb") as fin:
+            for match in matches:
+                findings.extend(
+                    generate_findings(target, match, binary, locations, fin)
+                )
+    except OSError as err:
+        raise FileAccessException(err)
 
     return findings
 
 
+def compile_rules(namespaces: Dict[str, str], cache: str = None) -> yara.Rules:
+    """Compiles YARA rules, reusing previously compiled rules from the optional cache.
+
+    Compiled rules are keyed on the path, modification time, and size of every rule
+    file, as well as the version of YARA. Files included by rules are not tracked, so a
+    cache should only be used where included files do not change independently.
+    """
+    if not cache:
+        return yara.compile(filepaths=namespaces)
+
+    key = hashlib.sha256(bytes(yara.YARA_VERSION, "utf-8"))
+    for namespace, path in sorted(namespaces.items()):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # Defer to the compiler to report the missing rule.
+            return yara.compile(filepaths=namespaces)
+
+        identity = f"{namespace}:{path}:{stat.st_mtime_ns}:{stat.st_size}"
+        key.update(bytes(identity, "utf-8"))
+
+    cache = os.path.expanduser(cache)
+    compiled = os.path.join(cache, f"rules-{key.hexdigest()}.yarac")
+
+    try:
+        return yara.load(compiled)
+    except yara.Error:
+        pass
+
+    ruleset = yara.compile(filepaths=namespaces)
+
+    # Failing to save compiled rules to the cache is not fatal, they'll just be compiled
+    # again next time. Rules are saved to a temporary file first, so concurrent runs
+    # never load a partially written file.
+    try:
+        os.makedirs(cache, mode=0o700, exist_ok=True)
+        ruleset.save(f"{compiled}.{os.getpid()}")
+        os.replace(f"{compiled}.{os.getpid()}", compiled)
+    except (OSError, yara.Error):
+        pass
+
+    return ruleset
+
+
 def run(
     targets: List[manifest.Entry],
     pack: pack.Format,
     workers: int = 10,
     skip_on_eacces: bool = True,
+    cache: str = None,
 ) -> List[finding.Entry]:
     """
     Executes the rules based matcher on all input files, returning a list of finding
-    Entry objects.
+    Entry objects. Compiled rules are reused from the cache directory, if provided.
     """
     findings = []
 
@@ -205,7 +315,7 @@ def run(
         namespaces[namespace] = rule.path
 
     try:
-        ruleset = yara.compile(filepaths=namespaces)
+        ruleset = compile_rules(namespaces, cache)
     except yara.Error as err:
         raise InvalidFormatException(err)
 
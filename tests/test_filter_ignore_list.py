@@ -1,6 +1,7 @@
 """Tests the STACS ignore list filter."""
 
 import os
+import re
 import unittest
 
 import stacs.scan
@@ -103,6 +104,11 @@ class STACSFilterIgnoreListTestCase(unittest.TestCase):
         miss = stacs.scan.model.ignore_list.Entry(pattern=r"\.shasums$", reason="Test")
         self.assertEqual(stacs.scan.filter.ignore_list.by_pattern(finding, miss), False)
 
+        # Pattern differs, where word boundaries must account for non-ASCII characters.
+        miss = stacs.scan.model.ignore_list.Entry(pattern=r"\btests\b", reason="Test")
+        unicode = finding.copy(update={"path": "/a/étests/a"})
+        self.assertEqual(stacs.scan.filter.ignore_list.by_pattern(unicode, miss), False)
+
         # Pattern matches, reference differs.
         miss = stacs.scan.model.ignore_list.Entry(
             pattern=".*/tests/.*", reason="Test", references=["OtherRule"]
@@ -169,3 +175,78 @@ class STACSFilterIgnoreListTestCase(unittest.TestCase):
             md5="fa19207ef28b6a97828e3a22b11290e9", reason="Test", offset=1234
         )
         self.assertEqual(stacs.scan.filter.ignore_list.by_hash(finding, miss), False)
+
+    def test_process(self):
+        """Validate that the first matching ignore list entry is used."""
+        findings = [
+            stacs.scan.model.finding.Entry(
+                path="/a/tests/a",
+                md5="fa19207ef28b6a97828e3a22b11290e9",
+                location=stacs.scan.model.finding.Location(
+                    offset=300,
+                ),
+                source=stacs.scan.model.finding.Source(
+                    module="stacs.scan.scanner.rules",
+                    reference="SomeRule",
+                ),
+            ),
+            stacs.scan.model.finding.Entry(
+                path="/a/b",
+                md5="cf42e6f36da80658591489975bbd845b",
+                location=stacs.scan.model.finding.Location(
+                    offset=300,
+                ),
+                source=stacs.scan.model.finding.Source(
+                    module="stacs.scan.scanner.rules",
+                    reference="SomeRule",
+                ),
+            ),
+        ]
+        ignores = stacs.scan.model.ignore_list.Format(
+            ignore=[
+                # Pattern matches, but reference differs.
+                stacs.scan.model.ignore_list.Entry(
+                    pattern=".*/tests/.*", reason="Miss", references=["OtherRule"]
+                ),
+                # Pattern matches, and appears before the hash match.
+                stacs.scan.model.ignore_list.Entry(
+                    pattern=".*/tests/.*", reason="Pattern"
+                ),
+                # Hash matches.
+                stacs.scan.model.ignore_list.Entry(
+                    md5="fa19207ef28b6a97828e3a22b11290e9", reason="Hash"
+                ),
+            ]
+        )
+
+        results = stacs.scan.filter.ignore_list.process(findings, ignores)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0].ignore.reason, "Pattern")
+        self.assertEqual(results[1].ignore, None)
+
+    def test_compile_prefilter(self):
+        """Validate that patterns are only combined where safe to do so."""
+        prefilter = stacs.scan.filter.ignore_list.compile_prefilter(
+            [".*/tests/.*", r"\.shasums$", r"\.shasums$"]
+        )
+        self.assertTrue(prefilter.search("/a/tests/a"))
+        self.assertTrue(prefilter.search("/a/b.shasums"))
+        self.assertFalse(prefilter.search("/a/b"))
+
+        # Patterns must match the same paths when combined as they do individually,
+        # including paths containing non-ASCII characters.
+        patterns = [r"\bsecret", r"\w+/\w+\.py$"]
+        prefilter = stacs.scan.filter.ignore_list.compile_prefilter(patterns)
+
+        for path in ["/x/ésecret.txt", "/x/secret.txt", "/root/ünï/tests/é.py"]:
+            self.assertEqual(
+                bool(prefilter.search(path)),
+                any(re.search(pattern, path) for pattern in patterns),
+            )
+
+        # Groups may be back referenced by number, and inline flags may apply to all
+        # patterns, so these patterns cannot be combined.
+        for pattern in [r"(a)\1", "(?i)tests"]:
+            self.assertIsNone(
+                stacs.scan.filter.ignore_list.compile_prefilter([".*", pattern])
+            )
@@ -1,8 +1,15 @@
 """Tests the STACS filepath loader."""
 
+import gzip
+import hashlib
+import io
 import os
+import tarfile
+import tempfile
 import unittest
 
+import stacs.scan
+
 
 class STACSLoaderFilepathTestCase(unittest.TestCase):
     """Tests the STACS filepath loader."""
@@ -16,3 +23,60 @@ class STACSLoaderFilepathTestCase(unittest.TestCase):
     def tearDown(self):
         """Ensure everything is torn down between tests."""
         pass
+
+    def test_metadata(self):
+        """Ensure that files smaller than a single chunk are correctly identified."""
+        content = gzip.compress(b"STACS")
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "small.gz")
+            with open(path, "wb") as fout:
+                fout.write(content)
+
+            entry = stacs.scan.loader.filepath.metadata(path)
+
+        self.assertEqual(entry.mime, "application/gzip")
+        self.assertEqual(entry.md5, hashlib.md5(content).hexdigest())
+        self.assertEqual(entry.size, len(content))
+
+    def test_finder_compressed_tarball(self):
+        """Ensure compressed tarballs are extracted without an intermediate file."""
+        content = b"STACS"
+        tarball = io.BytesIO()
+
+        with tarfile.open(fileobj=tarball, mode="w") as writer:
+            member = tarfile.TarInfo("directory/file.txt")
+            member.size = len(content)
+            writer.addfile(member, io.BytesIO(content))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "input", "archive.tar.gz")
+            cache = os.path.join(directory, "cache")
+            os.makedirs(os.path.dirname(path))
+            os.makedirs(cache)
+
+            with open(path, "wb") as fout:
+                fout.write(gzip.compress(tarball.getvalue()))
+
+            entries = stacs.scan.loader.filepath.finder(path, cache, workers=1)
+
+        overlays = sorted(entry.overlay for entry in entries if entry.overlay)
+        self.assertEqual(overlays, [f"{path}!archive.tar!directory/file.txt"])
+
+    def test_metadata_batch(self):
+        """Ensure unreadable files are skipped without discarding the batch."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "file.txt")
+            missing = os.path.join(directory, "missing.txt")
+            with open(path, "wb") as fout:
+                fout.write(b"STACS")
+
+            files = [(missing, None), (path, "archive!file.txt")]
+            entries = stacs.scan.loader.filepath.metadata_batch(files, "parent")
+
+            with self.assertRaises(stacs.scan.exceptions.FileAccessException):
+                stacs.scan.loader.filepath.metadata_batch(files, skip_on_eacces=False)
+
+        self.assertEqual([entry.path for entry in entries], [path])
+        self.assertEqual(entries[0].overlay, "archive!file.txt")
+        self.assertEqual(entries[0].parent, "parent")
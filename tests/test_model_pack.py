@@ -24,3 +24,16 @@ class STACSModelPackTestCase(unittest.TestCase):
         """Ensure that simple packs can be loaded."""
         with open(os.path.join(self.fixtures_path, "001-simple.valid.json"), "r") as f:
             stacs.scan.model.pack.Format(**json.load(f))
+
+    def test_hierarchical_loading(self):
+        """Ensure that packs included more than once are only loaded once."""
+        pack = stacs.scan.model.pack.from_file(
+            os.path.join(self.fixtures_path, "003-diamond.valid.json")
+        )
+        self.assertEqual(len(pack.pack), 6)
+        self.assertEqual(len(pack.include), 0)
+
+        pack = stacs.scan.model.pack.from_file(
+            os.path.join(self.fixtures_path, "003-cycle.valid.json")
+        )
+        self.assertEqual(len(pack.pack), 1)
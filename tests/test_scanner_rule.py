@@ -1,9 +1,12 @@
 """Tests the STACS Scanner Rule module."""
 
+import base64
 import os
+import tempfile
 import unittest
 
 import stacs.scan
+import yara
 
 
 class STACSScannerRuleTestCase(unittest.TestCase):
@@ -71,3 +74,77 @@ class STACSScannerRuleTestCase(unittest.TestCase):
         self.assertEqual(len(context.before), 20)
         self.assertEqual(len(context.finding), 40)
         self.assertEqual(len(context.after), 20)
+
+    def test_generate_sample_context(self):
+        """Ensures that binary samples include a single encoded context."""
+        content = b"\x00" * 30 + b"SECRET" + b"\xff" * 30
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "binary.bin")
+            with open(path, "wb") as fout:
+                fout.write(content)
+
+            target = stacs.scan.model.manifest.Entry(path=path)
+            context = stacs.scan.scanner.rules.generate_sample(target, 30, 6)
+
+        self.assertTrue(context.binary)
+        self.assertEqual(base64.b64decode(context.context), content[10:56])
+
+    def test_generate_location(self):
+        """Ensures that line numbers are correct for byte offsets past a chunk."""
+        chunk_size = stacs.scan.constants.CHUNK_SIZE
+        content = ("é\n" * chunk_size).encode("utf-8") + b"SECRET\n"
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "text.txt")
+            with open(path, "wb") as fout:
+                fout.write(content)
+
+            target = stacs.scan.model.manifest.Entry(path=path, mime="text/plain")
+            location = stacs.scan.scanner.rules.generate_location(
+                target, content.index(b"SECRET")
+            )
+
+        self.assertEqual(location.line, chunk_size + 1)
+
+    def test_compile_rules_cache(self):
+        """Ensures that compiled rules are cached, and recompiled when changed."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "rule.yar")
+            cache = os.path.join(directory, "cache")
+            with open(path, "w") as fout:
+                fout.write('rule First { strings: $a = "STACS" condition: $a }')
+
+            stacs.scan.scanner.rules.compile_rules({"rule": path}, cache)
+            self.assertEqual(len(os.listdir(cache)), 1)
+
+            ruleset = stacs.scan.scanner.rules.compile_rules({"rule": path}, cache)
+            self.assertEqual(len(os.listdir(cache)), 1)
+            self.assertEqual(ruleset.match(data="STACS")[0].rule, "First")
+
+            with open(path, "w") as fout:
+                fout.write('rule Second { strings: $a = "STACS" condition: $a }')
+
+            ruleset = stacs.scan.scanner.rules.compile_rules({"rule": path}, cache)
+            self.assertEqual(len(os.listdir(cache)), 2)
+            self.assertEqual(ruleset.match(data="STACS")[0].rule, "Second")
+
+    def test_generate_findings_meta(self):
+        """Ensures that rule metadata is converted to the types of the finding."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "target.txt")
+            with open(path, "w") as fout:
+                fout.write("STACS")
+
+            ruleset = yara.compile(
+                source=(
+                    "rule Meta { meta: version = 1 description = 2 "
+                    'strings: $a = "STACS" condition: $a }'
+                )
+            )
+            target = stacs.scan.model.manifest.Entry(path=path, md5="0" * 32)
+            findings = stacs.scan.scanner.rules.matcher(target, ruleset)
+
+        self.assertEqual(len(findings), 1)
+        self.assertEqual(findings[0].source.version, "1")
+        self.assertEqual(findings[0].source.description, "2")